@@ -1,4 +1,6 @@
+import concurrent.futures
 import logging
+import os
 import pathlib
 import traceback
 
@@ -60,6 +62,8 @@ def process_sbe_file(path,
     """
     Process seabird file using default psa files.
     Option to override psa files in psa_paths
+    The file is not processed if input files and options are unchanged since last processing. Use force=True to
+    always process.
     """
     path = pathlib.Path(path)
     cont = SBEProcessingHandler(target_root_directory=target_root_directory, file_handler=file_handler, 
@@ -80,6 +84,64 @@ def process_sbe_file(path,
     return cont.pack
 
 
+class CastResult:
+    """ Result from processing one cast in process_sbe_files """
+
+    def __init__(self, path, pack=None, error=None):
+        self.path = pathlib.Path(path)
+        self.pack = pack
+        self.error = error
+
+    def __repr__(self):
+        if self.ok:
+            return f'CastResult: {self.path} (ok)'
+        return f'CastResult: {self.path} (failed)'
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def _process_sbe_file_job(path, kwargs):
+    # Runs in a worker process. The traceback is returned as a string since exceptions are not always picklable.
+    try:
+        return process_sbe_file(path, **kwargs), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def process_sbe_files(paths, max_workers=None, **kwargs):
+    """
+    Process many seabird files. Each file is processed with process_sbe_file (kwargs are passed on).
+    The files are processed in a pool of max_workers processes (default is number of cpus). Each cast runs in its own
+    job directory with its own copies of the psa files. With max_workers=1 the files are processed one by one in the
+    current process.
+    Returns a list of CastResult in the same order as paths. A failing cast does not stop the others.
+    """
+    paths = [pathlib.Path(path) for path in paths]
+    if not paths:
+        return []
+    max_workers = min(max_workers or os.cpu_count() or 1, len(paths))
+    if max_workers == 1:
+        outcomes = [_process_sbe_file_job(path, kwargs) for path in paths]
+    else:
+        outcomes = []
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_process_sbe_file_job, path, kwargs) for path in paths]
+            for future in futures:
+                try:
+                    outcomes.append(future.result())
+                except Exception:
+                    # Worker died or result could not be sent back
+                    outcomes.append((None, traceback.format_exc()))
+    results = []
+    for path, (pack, error) in zip(paths, outcomes):
+        if error:
+            logger.error(f'Could not process file {path}: {error}')
+        results.append(CastResult(path, pack=pack, error=error))
+    return results
+
+
 def reprocess_sbe_file(path,
                        target_root_directory=None,
                        config_root_directory=None, 
@@ -87,10 +149,13 @@ def reprocess_sbe_file(path,
                        surfacesoak='normal',
                        tau=False,
                        overwrite=False,
-                       psa_paths=None):
+                       psa_paths=None,
+                       force=False):
     """
     Reprocess seabird file using psa files stored together with raw files.
     Option to override psa files in psa_paths
+    The file is not processed if input files and options are unchanged since last processing. Use force=True to
+    always process.
     """
     path = pathlib.Path(path)
     cont = SBEProcessingHandler(target_root_directory=target_root_directory, file_handler=file_handler, 
@@ -100,7 +165,7 @@ def reprocess_sbe_file(path,
     cont.select_and_confirm_file(path)
     cont.load_psa_config_zip()
     cont.load_psa_config_list(psa_paths)
-    cont.process_file()
+    cont.process_file(force=force)
 
 
 def create_standard_format_for_packages(packs,
@@ -109,9 +174,11 @@ def create_standard_format_for_packages(packs,
                                         overwrite=False,
                                         sharkweb_btl_row_file=None,
                                         old_key=False, 
+                                        batch=False,
                                         **kwargs):
     """
     Use to create standard format. Creates sensorinfo file.
+    With batch=True the standard format files for all packages are created in one ctdpy session.
     """
     sharkweb_meta = {}
     if sharkweb_btl_row_file:
@@ -123,6 +190,7 @@ def create_standard_format_for_packages(packs,
         packs = [packs]
 
     new_packs = []
+    posts = []
     for pack in packs:
         meta = kwargs
         if sharkweb_meta:
@@ -134,8 +202,21 @@ def create_standard_format_for_packages(packs,
                 meta.update(webmeta)
         post = SBEPostProcessing(pack, file_handler=file_handler, overwrite=overwrite, old_key=old_key, **meta)
         # post.set_config_root_directory(config_root_directory)
+        if batch:
+            post.create_independent_files()
+            post.update_package()
+            posts.append(post)
+            continue
         post.create_all_files()
         new_packs.append(post.pack)
+
+    if posts:
+        obj = standard_format.CreateStandardFormat(file_handler=file_handler, overwrite=overwrite, old_key=old_key,
+                                                   **kwargs)
+        obj.create_from_packages([post.pack for post in posts])
+        for post in posts:
+            post.update_package_with_standard_format()
+            new_packs.append(post.pack)
     return new_packs
 
 
@@ -1,13 +1,37 @@
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
 import file_explorer
 import datetime
+import logging
+import os
 import pathlib
+import traceback
+
+import numpy as np
 from sharkpylib import geography
 
+logger = logging.getLogger(__name__)
+
 
 class ASVPfile:
 
     def __init__(self, pack):
         self.file = pack.get_file(prefix=None, suffix='.cnv')
+        self._z_data = None
+        self._vel_data = None
+
+    def _load_data(self):
+        # Mapped data is read once
+        if self._z_data is not None:
+            return
+        data = self.file.get_data(mapped=True)
+        self._z_data = np.asarray(data['PRES_CTD'], dtype=float)
+        self._vel_data = np.asarray(data['SVEL_CTD'], dtype=float)
+
+    def get_profile_string(self):
+        """ Returns all "z x" rows as one string (formatted column wise) """
+        rows = np.char.add(np.char.add(np.char.mod('%.2f', self.z_data), ' '), np.char.mod('%.2f', self.vel_data))
+        return '\n'.join(rows.tolist())
 
     def get_header_string(self):
         return f'( SoundVelocity {self.version} {self.id} {self.time} {self.lat} {self.lon} {self.radii} ' \
@@ -16,33 +40,33 @@ class ASVPfile:
     def write_file(self, file_path=None, overwrite=False):
         if not file_path:
             path = pathlib.Path(self.file.path.parent, f'{self.file.path.stem}.asvp')
-            print('a', path)
         else:
             path = pathlib.Path(file_path)
-            print('b', path)
         if path.is_file() and path.suffix != '.asvp':
             path = pathlib.Path(path.parent, f'{path.stem}.asvp')
-            print('c', path)
         elif path.is_dir():
             path = pathlib.Path(path, f'{self.file.path.stem}.asvp')
-            print('d', path)
+        logger.debug(f'Writing asvp file: {path}')
         if path.exists() and not overwrite:
             raise FileExistsError(path)
 
         lines = [self.get_header_string()]
-        for z, x in zip(self.z_data, self.vel_data):
-            lines.append(f'{z:.2f} {x:.2f}')
+        if len(self.z_data):
+            lines.append(self.get_profile_string())
         lines.append('')
         with open(path, 'w') as fid:
             fid.write('\n'.join(lines))
+        return path
 
     @property
     def z_data(self):
-        return self.file.get_data(mapped=True)['PRES_CTD']
+        self._load_data()
+        return self._z_data
 
     @property
     def vel_data(self):
-        return self.file.get_data(mapped=True)['SVEL_CTD']
+        self._load_data()
+        return self._vel_data
 
     @staticmethod
     def format_time(dtime):
@@ -97,6 +121,64 @@ class ASVPfile:
         return str(len(self.z_data))
 
 
+def _create_asvp_file_job(cnv_path, file_path, overwrite):
+    # Runs in a worker process
+    try:
+        pack = file_explorer.get_package_for_file(cnv_path)
+        return ASVPfile(pack).write_file(file_path, overwrite=overwrite), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def _get_job_outcome(future):
+    # Errors in the job are returned by the job. Errors from the pool are handled here so that one failing package
+    # does not stop the others
+    try:
+        return future.result()
+    except BrokenProcessPool:
+        return None, f'Worker process died: {traceback.format_exc()}'
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def create_asvp_files_for_packages(packs, directory=None, overwrite=False, max_workers=None):
+    """
+    Creates asvp files for all packages in a pool of max_workers processes (default is number of cpus).
+    Files are written to directory (default is next to the cnv file).
+    Returns a list with the asvp file path for each package (None if failed) in the same order as packs.
+    """
+    cnv_paths = [pack.get_file_path(prefix=None, suffix='.cnv') for pack in packs]
+    jobs = [(path, directory, overwrite) for path in cnv_paths if path]
+    if not jobs:
+        return [None] * len(cnv_paths)
+    max_workers = min(max_workers or os.cpu_count() or 1, len(jobs))
+    if max_workers == 1:
+        outcomes = [_create_asvp_file_job(*job) for job in jobs]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_create_asvp_file_job, *job) for job in jobs]
+            outcomes = [_get_job_outcome(future) for future in futures]
+    outcomes = iter(outcomes)
+    result = []
+    for pack, cnv_path in zip(packs, cnv_paths):
+        if not cnv_path:
+            logger.error(f'No cnv file for package: {pack.key}')
+            result.append(None)
+            continue
+        path, error = next(outcomes)
+        if error:
+            logger.error(f'Could not create asvp file for package {pack.key}: {error}')
+        result.append(path)
+    return result
+
+
+def create_asvp_files_for_packages_in_directory(directory, output_directory=None, overwrite=False, max_workers=None):
+    """ Creates asvp files for all packages in directory. See create_asvp_files_for_packages """
+    packs = file_explorer.get_packages_in_directory(directory, as_list=True)
+    return create_asvp_files_for_packages(packs, directory=output_directory, overwrite=overwrite,
+                                          max_workers=max_workers)
+
+
 if __name__ == '__main__':
     pack = file_explorer.get_packages_in_directory(r'C:\mw\temmp\temp_mh_ibts\local\2022\cnv', as_list=True)[0]
     asvp = ASVPfile(pack)
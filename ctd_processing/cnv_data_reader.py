@@ -0,0 +1,212 @@
+import mmap
+import pathlib
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class CnvDataReader:
+    """
+    Read only access to the data section of a cnv file through a memory map.
+    The data section in a cnv file has fixed record width. The byte offset to the first data row (after *END*) and the
+    record length are saved when the file is opened. Any row or column can then be reached by offset arithmetic
+    without reading the whole file.
+    """
+    end_string = b'*END*'
+
+    def __init__(self, path):
+        self._path = pathlib.Path(path)
+        self._fid = None
+        self._mmap = None
+
+        self._data_offset = None
+        self._row_length = 0
+        self._record_length = 0
+        self._value_length = 0
+        self._nr_columns = 0
+        self._nr_rows = 0
+        self._names = {}
+
+        self._open()
+
+    def __str__(self):
+        return f'CnvDataReader: {self._path}'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _open(self):
+        self._fid = open(self._path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._fid.fileno(), 0, access=mmap.ACCESS_READ)
+            self._save_index()
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Views returned from get_column_strings/get_strings are still in use.
+                # The memory map is closed when the last view is released.
+                logger.debug(f'Memory map still in use: {self._path}')
+            self._mmap = None
+        if self._fid is not None:
+            self._fid.close()
+            self._fid = None
+
+    def _save_index(self):
+        end_index = self._mmap.find(self.end_string)
+        if end_index == -1:
+            raise ValueError(f'Could not find {self.end_string.decode()} in file: {self._path}')
+        self._data_offset = self._mmap.find(b'\n', end_index) + 1 or len(self._mmap)
+        self._save_names()
+
+        # Blank lines are allowed between *END* and the first data row
+        first_row_offset = self._data_offset
+        while True:
+            row_end = self._mmap.find(b'\n', first_row_offset)
+            if row_end == -1:
+                row_end = len(self._mmap)
+            if self._mmap[first_row_offset:row_end].strip() or row_end == len(self._mmap):
+                break
+            first_row_offset = row_end + 1
+        self._data_offset = first_row_offset
+
+        first_row = self._mmap[first_row_offset:row_end]
+        if not first_row.strip():
+            # No data rows. Columns are given by the header.
+            self._nr_columns = len(self._names)
+            return
+        # Record length includes line break (\n or \r\n)
+        self._record_length = len(first_row) + 1
+        self._row_length = len(first_row.rstrip())
+        self._nr_columns = len(first_row.split())
+        value_length = self._row_length / self._nr_columns
+        if int(value_length) != value_length:
+            raise ValueError(f'Something is wrong in the file! Not fixed width in data section: {self._path}')
+        self._value_length = int(value_length)
+
+        self._nr_rows = (len(self._mmap) - self._data_offset) // self._record_length
+        rest = self._mmap[self._data_offset + self._nr_rows * self._record_length:]
+        if rest.strip():
+            # Last row without line break
+            if b'\n' in rest or len(rest.rstrip()) != self._row_length:
+                raise ValueError(f'Something is wrong in the file! Not fixed record length in data section: '
+                                 f'{self._path}')
+            self._nr_rows += 1
+        line_breaks = np.ndarray(shape=((len(self._mmap) - self._data_offset) // self._record_length,),
+                                 dtype=np.uint8,
+                                 buffer=self._mmap,
+                                 offset=self._data_offset + self._record_length - 1,
+                                 strides=(self._record_length,))
+        if (line_breaks != ord('\n')).any():
+            raise ValueError(f'Something is wrong in the file! Not fixed record length in data section: '
+                             f'{self._path}')
+
+    def _save_names(self):
+        self._names = {}
+        for line in self._mmap[:self._data_offset].split(b'\n'):
+            if not line.startswith(b'# name'):
+                continue
+            name, par = line.decode('cp1252').split('=', 1)
+            self._names[int(name.strip().split()[-1])] = par.strip()
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def data_offset(self):
+        """ Byte offset to the first data row """
+        return self._data_offset
+
+    @property
+    def record_length(self):
+        """ Number of bytes for one data row including line break """
+        return self._record_length
+
+    @property
+    def value_length(self):
+        return self._value_length
+
+    @property
+    def nr_columns(self):
+        return self._nr_columns
+
+    @property
+    def nr_rows(self):
+        return self._nr_rows
+
+    @property
+    def names(self):
+        """ Column names in file as dict (index: name) """
+        return dict(self._names)
+
+    def get_header_bytes(self):
+        return self._mmap[:self._data_offset]
+
+    def get_header_lines(self):
+        return self.get_header_bytes().decode('cp1252').splitlines()
+
+    def get_column_index(self, match_string):
+        """ Returns the index of the first column whose name contains match_string """
+        for index, name in self._names.items():
+            if match_string in name:
+                return index
+
+    def get_row_offset(self, row):
+        if row < 0:
+            row += self._nr_rows
+        if not 0 <= row < self._nr_rows:
+            raise IndexError(f'Row index out of range: {row}')
+        return self._data_offset + row * self._record_length
+
+    def get_row_bytes(self, start=None, stop=None):
+        """ Returns the raw bytes for rows [start:stop] (including line breaks) """
+        start, stop, _ = slice(start, stop).indices(self._nr_rows)
+        stop = max(start, stop)
+        return self._mmap[self._data_offset + start * self._record_length:
+                          self._data_offset + stop * self._record_length]
+
+    def _get_view(self, shape, dtype, offset, strides, start=None, stop=None):
+        start, stop, _ = slice(start, stop).indices(self._nr_rows)
+        stop = max(start, stop)
+        return np.ndarray(shape=(stop - start,) + shape,
+                          dtype=dtype,
+                          buffer=self._mmap,
+                          offset=self._data_offset + start * self._record_length + offset,
+                          strides=(self._record_length,) + strides)
+
+    def get_column_strings(self, index, start=None, stop=None):
+        """
+        Returns the values in column index as a numpy array of fixed width byte strings.
+        The array is a view of the memory map (no copy). Rows are selected with start and stop as in a slice.
+        """
+        if not 0 <= index < self._nr_columns:
+            raise IndexError(f'Column index out of range: {index}')
+        if not self._nr_rows:
+            return np.empty(0, dtype='S1')
+        return self._get_view((), f'S{self._value_length}', index * self._value_length, (), start=start, stop=stop)
+
+    def get_strings(self, start=None, stop=None):
+        """ Returns all values as a 2D numpy array (rows, columns) of fixed width byte strings. The array is a view. """
+        if not self._nr_rows:
+            return np.empty((0, self._nr_columns), dtype='S1')
+        return self._get_view((self._nr_columns,), f'S{self._value_length}', 0, (self._value_length,),
+                              start=start, stop=stop)
+
+    def get_column(self, index, start=None, stop=None):
+        """ Returns the values in column index as a float array """
+        return self.get_column_strings(index, start=start, stop=stop).astype(np.float64)
+
+    def get_data(self, start=None, stop=None):
+        """ Returns all values as a 2D float array (rows, columns) """
+        return self.get_strings(start=start, stop=stop).astype(np.float64)
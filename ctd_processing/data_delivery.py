@@ -1,45 +1,269 @@
+import concurrent.futures
+import datetime
+import hashlib
+import io
+import logging
+import os
 import shutil
+import tarfile
+import tempfile
+import zipfile
 from pathlib import Path
 
 from ctd_processing import delivery_note
 from ctd_processing import metadata
 from ctd_processing import sensor_info
+from ctd_processing.processing.processing_manifest import get_file_hash
 
+logger = logging.getLogger(__name__)
 
-def create_dv_data_delivery_for_packages(packs, output_dir, **kwargs):
-    sorted_packs = sorted(packs)
-    sub_dir = Path(output_dir, f'dv_delivery_{sorted_packs[0].date}_{sorted_packs[-1].date}')
-    sub_dir.mkdir(parents=True, exist_ok=True)
-    sensor_info.create_sensor_info_summary_file_from_packages(packs, output_dir=sub_dir, **kwargs)
-    metadata.create_metadata_summary_file_from_packages(packs, output_dir=sub_dir, **kwargs)
-    delivery_note.create_deliverynote_summary_file_from_packages(packs, output_dir=sub_dir, **kwargs)
+STAGE_MODES = ['copy', 'hardlink', 'reflink']
+# ioctl request code for FICLONE (Linux)
+_FICLONE = 0x40049409
 
-    # Data
-    data_dir = Path(sub_dir, 'data')
-    data_dir.mkdir(parents=True, exist_ok=True)
-    cnv_dir = Path(sub_dir, 'cnv')
-    cnv_dir.mkdir(parents=True, exist_ok=True)
-    raw_data_dir = Path(sub_dir, 'raw')
-    raw_data_dir.mkdir(parents=True, exist_ok=True)
+
+def _is_identical(source_path, target_path):
+    # Same file (hardlink) or same content. Size and modification time are checked before the content is compared.
+    if not target_path.exists():
+        return False
+    if os.path.samefile(source_path, target_path):
+        return True
+    source_stat = os.stat(source_path)
+    target_stat = os.stat(target_path)
+    if source_stat.st_size != target_stat.st_size or source_stat.st_mtime_ns != target_stat.st_mtime_ns:
+        return False
+    return get_file_hash(source_path) == get_file_hash(target_path)
+
+
+def _get_unique_source_target_paths(source_target_paths):
+    """ Removes duplicate (source_path, target_path). Raises ValueError if different sources have the same target """
+    sources = {}
+    unique = []
+    for source_path, target_path in source_target_paths:
+        source_path = Path(source_path)
+        target_path = Path(target_path)
+        key = os.path.abspath(target_path)
+        if key in sources:
+            if os.path.abspath(sources[key]) != os.path.abspath(source_path):
+                raise ValueError(f'Different source files for target {target_path}: {sources[key]}, {source_path}')
+            continue
+        sources[key] = source_path
+        unique.append((source_path, target_path))
+    return unique
+
+
+def _same_filesystem(source_path, target_path):
+    return os.stat(source_path).st_dev == os.stat(target_path.parent).st_dev
+
+
+def _reflink(source_path, target_path):
+    import fcntl
+    with open(source_path, 'rb') as src, open(target_path, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+    shutil.copystat(source_path, target_path)
+
+
+def stage_file(source_path, target_path, mode='copy'):
+    """
+    Puts source_path at target_path. mode is one of:
+        copy: copy file and metadata (shutil.copy2)
+        hardlink: hard link to the source file if on the same file system
+        reflink: copy on write clone of the source file if supported by the file system (Linux)
+    A hardlink or reflink that is not possible falls back to copy. An existing target is replaced.
+    """
+    if mode not in STAGE_MODES:
+        raise ValueError(f'Invalid stage mode: {mode}')
+    if target_path.exists():
+        os.remove(target_path)
+    if mode != 'copy' and _same_filesystem(source_path, target_path):
+        try:
+            if mode == 'hardlink':
+                os.link(source_path, target_path)
+            else:
+                _reflink(source_path, target_path)
+            return target_path
+        except (OSError, ImportError):
+            if target_path.exists():
+                os.remove(target_path)
+            logger.debug(f'Could not {mode} {source_path}. Copying file')
+    shutil.copy2(source_path, target_path)
+    return target_path
+
+
+def stage_files(source_target_paths, mode='copy', max_workers=8, overwrite=False):
+    """
+    Stages all (source_path, target_path) in a pool of max_workers threads. Targets identical to the source are skipped.
+    Raises FileExistsError before anything is staged if a target exists (and is not identical) and overwrite is False.
+    Raises ValueError if different sources have the same target (duplicates of the same pair are staged once).
+    Returns the list of staged target paths.
+    """
+    to_stage = []
+    for source_path, target_path in _get_unique_source_target_paths(source_target_paths):
+        if _is_identical(source_path, target_path):
+            continue
+        if target_path.exists() and not overwrite:
+            raise FileExistsError(target_path)
+        to_stage.append((source_path, target_path))
+    if not to_stage:
+        return []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(to_stage)))) as executor:
+        futures = [executor.submit(stage_file, source_path, target_path, mode) for source_path, target_path in to_stage]
+    return [future.result() for future in futures]
+
+
+class _HashingReader:
+    """ File object wrapper that updates a sha256 hash with everything read """
+
+    def __init__(self, fid):
+        self._fid = fid
+        self.sha = hashlib.sha256()
+
+    def read(self, *args):
+        data = self._fid.read(*args)
+        self.sha.update(data)
+        return data
+
+
+class DeliveryArchive:
+    """
+    Writes files to one zip or tar archive (archive_format: zip, tar, tar.gz). Files are streamed from the source into
+    the archive and a sha256 checksum is calculated for each member while streaming. On close a manifest
+    (<root>/manifest.sha256, one line "<checksum>  <member name>" per member) is added to the archive.
+    The archive is written to a temporary file and moved in place on close.
+    """
+    archive_formats = {'zip': '.zip', 'tar': '.tar', 'tar.gz': '.tar.gz'}
+    chunk_size = 1024 * 1024
+
+    def __init__(self, path, root_name, archive_format='zip'):
+        if archive_format not in self.archive_formats:
+            raise ValueError(f'Invalid archive format: {archive_format}')
+        self.path = Path(path)
+        self.root_name = root_name
+        self.archive_format = archive_format
+        self.checksums = {}
+        self._temp_path = Path(self.path.parent, f'.{self.path.name}.{os.getpid()}.tmp')
+        if archive_format == 'zip':
+            self._archive = zipfile.ZipFile(self._temp_path, 'w', compression=zipfile.ZIP_DEFLATED)
+        elif archive_format == 'tar':
+            self._archive = tarfile.open(self._temp_path, 'w')
+        else:
+            self._archive = tarfile.open(self._temp_path, 'w:gz')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type:
+            self._archive.close()
+            os.remove(self._temp_path)
+            return
+        self.close()
+
+    def add_file(self, source_path, member_path):
+        """ member_path is relative to the root directory in the archive """
+        name = f'{self.root_name}/{member_path}'
+        if name in self.checksums:
+            raise FileExistsError(f'{name} (in archive {self.path})')
+        stat = os.stat(source_path)
+        with open(source_path, 'rb') as fid:
+            reader = _HashingReader(fid)
+            if self.archive_format == 'zip':
+                info = zipfile.ZipInfo(name, date_time=datetime.datetime.fromtimestamp(stat.st_mtime).timetuple()[:6])
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with self._archive.open(info, 'w', force_zip64=True) as member:
+                    for chunk in iter(lambda: reader.read(self.chunk_size), b''):
+                        member.write(chunk)
+            else:
+                info = tarfile.TarInfo(name)
+                info.size = stat.st_size
+                info.mtime = stat.st_mtime
+                self._archive.addfile(info, reader)
+        self.checksums[name] = reader.sha.hexdigest()
+
+    def _add_manifest(self):
+        lines = [f'{checksum}  {name}' for name, checksum in self.checksums.items()]
+        data = ('\n'.join(lines) + '\n').encode()
+        name = f'{self.root_name}/manifest.sha256'
+        if self.archive_format == 'zip':
+            self._archive.writestr(name, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = datetime.datetime.now().timestamp()
+            self._archive.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self._add_manifest()
+        self._archive.close()
+        os.replace(self._temp_path, self.path)
+        return self.path
+
+
+def _get_delivery_file_paths(packs):
+    """ Returns a list with (source path, sub directory in delivery) for all package files in the delivery """
+    file_paths = []
     for pack in packs:
         for source_path in pack.get_file_paths():
             if source_path.suffix in ['.metadata', '.deliverynote', '.jpg']:
                 continue
             if source_path.suffix == '.txt':
-                target_path = Path(data_dir, source_path.name)
+                file_paths.append((Path(source_path), 'data'))
             elif source_path.suffix in ['.cnv', '.sensorinfo']:
-                target_path = Path(cnv_dir, source_path.name)
+                file_paths.append((Path(source_path), 'cnv'))
             else:
-                target_path = Path(raw_data_dir, source_path.name)
-
-            if target_path.exists() and not kwargs.get('overwrite'):
-                raise FileExistsError(target_path)
-            shutil.copy2(source_path, target_path)
+                file_paths.append((Path(source_path), 'raw'))
+    return file_paths
 
 
+def _create_summary_files(packs, directory, **kwargs):
+    sensor_info.create_sensor_info_summary_file_from_packages(packs, output_dir=directory, **kwargs)
+    metadata.create_metadata_summary_file_from_packages(packs, output_dir=directory, **kwargs)
+    delivery_note.create_deliverynote_summary_file_from_packages(packs, output_dir=directory, **kwargs)
 
 
+def create_dv_data_delivery_for_packages(packs, output_dir, **kwargs):
+    """
+    Creates a delivery directory tree with summary files and sub directories data, cnv and raw.
+    With archive_format (zip, tar, tar.gz) the delivery is instead written to one archive, see
+    create_dv_data_delivery_archive_for_packages.
+    """
+    if kwargs.get('archive_format'):
+        return create_dv_data_delivery_archive_for_packages(packs, output_dir, **kwargs)
+    sorted_packs = sorted(packs)
+    sub_dir = Path(output_dir, f'dv_delivery_{sorted_packs[0].date}_{sorted_packs[-1].date}')
+    sub_dir.mkdir(parents=True, exist_ok=True)
+    _create_summary_files(packs, sub_dir, **kwargs)
 
+    # Data
+    for name in ['data', 'cnv', 'raw']:
+        Path(sub_dir, name).mkdir(parents=True, exist_ok=True)
+    source_target_paths = [(source_path, Path(sub_dir, name, source_path.name))
+                           for source_path, name in _get_delivery_file_paths(packs)]
 
+    # stage_mode: copy (default), hardlink or reflink. See stage_file
+    stage_files(source_target_paths,
+                mode=kwargs.get('stage_mode', 'copy'),
+                max_workers=kwargs.get('max_workers', 8),
+                overwrite=kwargs.get('overwrite'))
+    return sub_dir
 
 
+def create_dv_data_delivery_archive_for_packages(packs, output_dir, archive_format='zip', **kwargs):
+    """
+    Creates the delivery as one archive file in output_dir. The content is the same as the delivery directory tree.
+    Package files are streamed directly into the archive and a checksum manifest is added. Returns the archive path.
+    """
+    sorted_packs = sorted(packs)
+    root_name = f'dv_delivery_{sorted_packs[0].date}_{sorted_packs[-1].date}'
+    path = Path(output_dir, f'{root_name}{DeliveryArchive.archive_formats.get(archive_format, "")}')
+    if path.exists() and not kwargs.get('overwrite'):
+        raise FileExistsError(path)
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    with DeliveryArchive(path, root_name, archive_format=archive_format) as archive:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            _create_summary_files(packs, temp_dir, **kwargs)
+            for summary_path in sorted(Path(temp_dir).iterdir()):
+                archive.add_file(summary_path, summary_path.name)
+        for source_path, name in _get_delivery_file_paths(packs):
+            archive.add_file(source_path, f'{name}/{source_path.name}')
+    return path
@@ -0,0 +1,99 @@
+import collections
+import logging
+import os
+import pathlib
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class DirectoryIndex:
+    """
+    Cache of file listings. A listing is kept for each directory together with the modification time of the directory
+    and is reused as long as the modification time is unchanged. Files are also indexed on lower case stem.
+
+    File systems with coarse time resolution (FAT, some network drives) might not change the modification time if a
+    file is added in the same tick as the listing was made. A listing made less than mtime_resolution seconds after the
+    modification time of the directory is therefore never reused. Listings older than max_age seconds are made again
+    and at most max_entries listings are kept (least recently used are dropped).
+    Use invalidate after writing to a directory to be sure that the next listing is up to date.
+    """
+
+    def __init__(self, max_entries=2000, max_age=60., mtime_resolution=2.):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.mtime_resolution = mtime_resolution
+        self._listings = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_listing(self, directory):
+        directory = pathlib.Path(directory)
+        key = str(directory.absolute())
+        mtime = os.stat(directory).st_mtime_ns
+        with self._lock:
+            listing = self._listings.get(key)
+            if listing and listing['mtime'] == mtime and time.time() - listing['created'] < self.max_age:
+                self._listings.move_to_end(key)
+                return listing
+        created = time.time()
+        files = []
+        directories = []
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir():
+                    directories.append(pathlib.Path(entry.path))
+                else:
+                    files.append(pathlib.Path(entry.path))
+        stems = {}
+        for path in files + directories:
+            stems.setdefault(path.stem.lower(), []).append(path)
+        listing = dict(mtime=mtime,
+                       created=created,
+                       paths=sorted(files + directories),
+                       files=sorted(files),
+                       directories=sorted(directories),
+                       stems=stems)
+        if created - mtime / 1e9 < self.mtime_resolution:
+            # Directory changed very recently. Listing might miss files added in the same tick.
+            return listing
+        with self._lock:
+            self._listings[key] = listing
+            self._listings.move_to_end(key)
+            while len(self._listings) > self.max_entries:
+                self._listings.popitem(last=False)
+        return listing
+
+    def get_paths(self, directory):
+        """ Returns a list of all paths in directory (not recursive) """
+        return list(self._get_listing(directory)['paths'])
+
+    def get_paths_with_stem(self, directory, stem):
+        """ Returns a list of the paths in directory with the given stem (case insensitive) """
+        return list(self._get_listing(directory)['stems'].get(stem.lower(), []))
+
+    def invalidate(self, directory=None):
+        """ Removes the listing for directory (and all directories under it) from the cache. All if directory is None """
+        with self._lock:
+            if directory is None:
+                self._listings.clear()
+                return
+            key = str(pathlib.Path(directory).absolute())
+            for listing_key in list(self._listings):
+                if listing_key == key or listing_key.startswith(key + os.sep):
+                    self._listings.pop(listing_key)
+
+
+directory_index = DirectoryIndex()
+
+
+def get_paths(directory):
+    return directory_index.get_paths(directory)
+
+
+def get_paths_with_stem(directory, stem):
+    return directory_index.get_paths_with_stem(directory, stem)
+
+
+def invalidate(directory=None):
+    directory_index.invalidate(directory)
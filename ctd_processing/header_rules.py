@@ -0,0 +1,272 @@
+import re
+
+
+class HeaderEdit:
+    """
+    Holds a copy of the header lines while rules are applied.
+    Lines can be replaced (edit[i] = new_line) and rows can be inserted after a line. Indexes always refer to the
+    original header lines. Inserted rows are put in place when calling get_lines.
+    """
+    def __init__(self, lines):
+        self._lines = list(lines)
+        self._inserts = {}
+
+    def __len__(self):
+        return len(self._lines)
+
+    def __getitem__(self, index):
+        return self._lines[index]
+
+    def __setitem__(self, index, value):
+        self._lines[index] = value
+
+    def insert_after(self, index, rows):
+        self._inserts.setdefault(index, []).extend(rows)
+
+    def get_lines(self):
+        if not self._inserts:
+            return self._lines[:]
+        lines = []
+        for i, line in enumerate(self._lines):
+            lines.append(line)
+            lines.extend(self._inserts.get(i, []))
+        return lines
+
+
+class HeaderRule:
+    """
+    Base class for rules that modify the header of a cnv file.
+    A rule lists the strings it needs to find in the header in match_keys as (string, ignore_case). The line indexes
+    matching all keys are found in one pass over the header in HeaderRules.apply and handed to the rule in apply.
+    """
+
+    def __init__(self):
+        self.applied = False
+
+    @property
+    def match_keys(self):
+        return []
+
+    def apply(self, edit, index):
+        """
+        edit is a HeaderEdit object.
+        index is a dict with the matching line indexes (in original order) for each key in self.match_keys.
+        """
+        raise NotImplementedError
+
+
+class InsertRowsAfter(HeaderRule):
+    """
+    Inserts rows after the first line containing after_string. Each row is inserted after the previous row.
+    A row that is already present in the header is not inserted. The following row is then inserted after it.
+    """
+
+    def __init__(self, after_string, rows):
+        super().__init__()
+        self.after_string = after_string
+        self.rows = [row.strip() for row in rows]
+
+    @property
+    def match_keys(self):
+        return [(self.after_string, False)] + [(row, False) for row in self.rows]
+
+    def apply(self, edit, index):
+        matches = index[(self.after_string, False)]
+        anchor = matches[0] if matches else None
+        block = []
+        for row in self.rows:
+            existing = [i for i in index[(row, False)] if edit[i] == row]
+            if existing:
+                if anchor is not None and block:
+                    edit.insert_after(anchor, block)
+                    self.applied = True
+                block = []
+                anchor = index[(row, False)][0]
+                continue
+            if anchor is None:
+                continue
+            block.append(row)
+        if anchor is not None and block:
+            edit.insert_after(anchor, block)
+            self.applied = True
+
+
+class AppendToRow(HeaderRule):
+    """ Appends append_string to the first line containing match_string that does not already end with it """
+
+    def __init__(self, match_string, append_string):
+        super().__init__()
+        self.match_string = match_string
+        self.append_string = append_string
+
+    @property
+    def match_keys(self):
+        return [(self.match_string, False)]
+
+    def apply(self, edit, index):
+        for i in index[(self.match_string, False)]:
+            if edit[i].endswith(self.append_string):
+                continue
+            edit[i] = edit[i] + self.append_string.rstrip()
+            self.applied = True
+            break
+
+
+class ReplaceInRows(HeaderRule):
+    """
+    Replaces from_string with to_string in all lines containing match_string.
+    If ignore_if_present lines already containing to_string are left as they are.
+    """
+
+    def __init__(self, match_string, from_string, to_string, ignore_if_present=True, ignore_case=False):
+        super().__init__()
+        self.match_string = match_string
+        self.from_string = from_string
+        self.to_string = to_string
+        self.ignore_if_present = ignore_if_present
+        self.ignore_case = ignore_case
+
+    @property
+    def match_keys(self):
+        return [(self.match_string, self.ignore_case)]
+
+    def apply(self, edit, index):
+        for i in index[(self.match_string, self.ignore_case)]:
+            if self.ignore_if_present and self.to_string in edit[i]:
+                continue
+            edit[i] = edit[i].replace(self.from_string, self.to_string)
+            self.applied = True
+
+
+class ReplaceRow(HeaderRule):
+    """ Replaces the first line containing match_string with new_row """
+
+    def __init__(self, match_string, new_row):
+        super().__init__()
+        self.match_string = match_string
+        self.new_row = new_row.strip()
+
+    @property
+    def match_keys(self):
+        return [(self.match_string, False)]
+
+    def apply(self, edit, index):
+        matches = index[(self.match_string, False)]
+        if not matches:
+            return
+        edit[matches[0]] = self.new_row
+        self.applied = True
+
+
+class RowOffsetCondition:
+    """
+    True if the line offset rows below the first line containing match_string contains required_string.
+    The first line containing match_string can not be the first line in the header.
+    """
+
+    def __init__(self, match_string, offset, required_string):
+        self.match_string = match_string
+        self.offset = offset
+        self.required_string = required_string
+
+    @property
+    def match_keys(self):
+        return [(self.match_string, False), (self.required_string, False)]
+
+    def is_true(self, index):
+        matches = index[(self.match_string, False)]
+        if not matches or not matches[0]:
+            return False
+        return matches[0] + self.offset in index[(self.required_string, False)]
+
+
+class ConditionalRules(HeaderRule):
+    """ Applies all rules if condition is true """
+
+    def __init__(self, condition, rules):
+        super().__init__()
+        self.condition = condition
+        self.rules = list(rules)
+
+    @property
+    def match_keys(self):
+        keys = list(self.condition.match_keys)
+        for rule in self.rules:
+            keys.extend(rule.match_keys)
+        return keys
+
+    def apply(self, edit, index):
+        if not self.condition.is_true(index):
+            return
+        for rule in self.rules:
+            rule.apply(edit, index)
+        self.applied = True
+
+
+class HeaderRules:
+    """
+    Applies a list of HeaderRule objects to header lines.
+    All match strings are compiled into one regular expression and the lines matching each rule are found in a single
+    pass over the header. Matching is done on the original lines and the rules edit the lines in the order they are
+    added.
+    """
+
+    def __init__(self, rules=None):
+        self._rules = []
+        self._keys = []
+        self._pattern = None
+        self.add_rules(rules or [])
+
+    def __len__(self):
+        return len(self._rules)
+
+    def add_rule(self, rule):
+        self._rules.append(rule)
+        self._pattern = None
+
+    def add_rules(self, rules):
+        for rule in rules:
+            self.add_rule(rule)
+
+    @property
+    def rules(self):
+        return self._rules[:]
+
+    def _compile(self):
+        keys = []
+        for rule in self._rules:
+            for key in rule.match_keys:
+                if key not in keys:
+                    keys.append(key)
+        self._keys = keys
+        # Lower case matching is used to filter lines for all keys. Exact matching is done on filtered lines.
+        lower_strings = sorted({string.lower() for string, ignore_case in keys}, key=len, reverse=True)
+        self._pattern = re.compile('|'.join(re.escape(string) for string in lower_strings))
+
+    def get_index(self, lines):
+        """ Returns a dict with the indexes of all lines matching each key """
+        if self._pattern is None:
+            self._compile()
+        index = {key: [] for key in self._keys}
+        if not self._keys:
+            return index
+        for i, line in enumerate(lines):
+            lower_line = line.lower()
+            if not self._pattern.search(lower_line):
+                continue
+            for key in self._keys:
+                string, ignore_case = key
+                if ignore_case:
+                    if string.lower() in lower_line:
+                        index[key].append(i)
+                elif string in line:
+                    index[key].append(i)
+        return index
+
+    def apply(self, lines):
+        """ Returns new header lines with all rules applied """
+        index = self.get_index(lines)
+        edit = HeaderEdit(lines)
+        for rule in self._rules:
+            rule.apply(edit, index)
+        return edit.get_lines()
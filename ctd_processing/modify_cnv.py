@@ -1,7 +1,12 @@
 import datetime
+import os
+import pathlib
+import re
 import time
 import logging
 
+import numpy as np
+
 from file_explorer import patterns
 from file_explorer.seabird import xmlcon_parser
 from file_explorer.seabird.cnv_file import CnvFile
@@ -9,6 +14,8 @@ from file_explorer.seabird import edit_cnv
 
 from file_explorer.seabird.utils import get_header_form_information
 
+from ctd_processing import header_rules
+from ctd_processing.cnv_data_reader import CnvDataReader
 from ctd_processing import utils
 
 from ctd_processing.value_format import ValueFormat
@@ -142,6 +149,79 @@ class Header:
         lines[index] = new_value.strip()
 
 
+# Number of rows handled at a time when checking the data block. Keeps the temporary arrays small for large files.
+CHUNK_SIZE = 50000
+
+
+def get_chars(strings):
+    """ Returns a uint8 view (rows, columns, value_length) of the 2D array of byte strings """
+    return strings.view(np.uint8).reshape(strings.shape + (strings.dtype.itemsize,))
+
+
+def is_fixed_width(chars, chunk_size=CHUNK_SIZE):
+    """
+    chars is a 3D uint8 array (rows, columns, value_length) with the characters of the data rows.
+    Returns True if every field holds exactly one right aligned value (the block can be read column by column).
+    """
+    for start in range(0, len(chars), chunk_size):
+        is_value = chars[start:start + chunk_size] != ord(' ')
+        if not is_value[:, :, -1].all() or is_value[:, 1:, 0].any():
+            return False
+        # Once a value has started it must continue to the end of the field
+        if (is_value[:, :, 1:] < is_value[:, :, :-1]).any():
+            return False
+    return True
+
+
+def _get_nr_decimals(chars):
+    """ Returns the number of decimals for each row in chars (see get_value_format). -1 for rows without a dot. """
+    width = chars.shape[1]
+    is_dot = chars == ord('.')
+    has_dot = is_dot.any(axis=1)
+    if not has_dot.any():
+        return np.full(len(chars), -1, dtype=np.int8)
+
+    # Number of decimals is the number of characters between the last dot and the first "e"
+    is_value = (chars != ord(' ')) & (chars != 0)
+    start = is_value.argmax(axis=1).astype(np.int16)
+    end = width - is_value[:, ::-1].argmax(axis=1).astype(np.int16)
+    del is_value
+    is_e = chars == ord('e')
+    first_e = np.where(is_e.any(axis=1), is_e.argmax(axis=1).astype(np.int16), end)
+    del is_e, end
+    dot_before_e = is_dot & (np.arange(width, dtype=np.int16) < first_e[:, np.newaxis])
+    del is_dot
+    last_dot = width - 1 - dot_before_e[:, ::-1].argmax(axis=1).astype(np.int16)
+    nr_decimals = np.where(dot_before_e.any(axis=1), first_e - last_dot - 1, first_e - start)
+    nr_decimals[~has_dot] = -1
+    return nr_decimals
+
+
+def get_value_format(chars, chunk_size=CHUNK_SIZE):
+    """
+    Finds value format (d, f or e), number of decimals and sample value for a column. chars is a 2D uint8 array
+    (rows, width) with one value on each row padded with blanks or null bytes. The result is the same as calling
+    Parameter.add_data with every value in the column. Rows are handled chunk_size at a time.
+    Returns (value_format, nr_decimals, sample_value).
+    """
+    if not len(chars):
+        return 'd', None, None
+    value_format = Parameter.get_value_format_for_string(bytes(chars[-1]).strip(b' \0').decode())
+
+    # The first value with the highest number of decimals is the sample value
+    nr_decimals = -1
+    sample_row = None
+    for start in range(0, len(chars), chunk_size):
+        chunk_nr_decimals = _get_nr_decimals(chars[start:start + chunk_size])
+        row = chunk_nr_decimals.argmax()
+        if chunk_nr_decimals[row] > nr_decimals:
+            nr_decimals = int(chunk_nr_decimals[row])
+            sample_row = start + row
+    if sample_row is None:
+        return value_format, None, None
+    return value_format, nr_decimals, float(bytes(chars[sample_row]).strip(b' \0'))
+
+
 class Parameter:
     def __init__(self, use_value_format=False, value_format=None, index=None, name=None, description=None, **kwargs):
     # def __init__(self, use_cnv_info_format=False, cnv_info_object=None, index=None, name=None, **kwargs):
@@ -160,6 +240,9 @@ class Parameter:
         self._nr_decimals = None
         self.sample_value = None
         self._data = []
+        self._data_loader = None
+        self._missing_value = None
+        self._missing_value_str = None
         self.active = True
 
     def __getitem__(self, item):
@@ -211,36 +294,103 @@ class Parameter:
     def set_value_length(self, length):
         self._tot_value_length = length
 
-    def add_data(self, value_str):
+    @staticmethod
+    def get_value_format_for_string(value_str):
+        """ Returns the value format (d, f or e) for value_str """
+        if '.' not in value_str:
+            return 'd'
         string = value_str.strip('+-')
         if '+' in string or '-' in string:
-            self._value_format = 'e'
-        elif '.' in value_str:
-            self._value_format = 'f'
+            return 'e'
+        return 'f'
+
+    def _save_value_format(self, value_str):
+        # Updates value format and number of decimals from value_str. Returns True if value is a float
+        self._value_format = self.get_value_format_for_string(value_str)
         if '.' in value_str:
             self._set_nr_decimals(value_str)
+            return True
+        return False
+
+    def set_value_format(self, value_format, nr_decimals=None, sample_value=None):
+        """ Sets value format and number of decimals found for the whole column (see get_value_format) """
+        self._value_format = value_format
+        self._nr_decimals = nr_decimals
+        self.sample_value = sample_value
+
+    def add_data(self, value_str):
+        if self._save_value_format(value_str):
             value = float(value_str)
         else:
             value = int(value_str)
-            self._value_format = 'd'
-
         self._data.append(value)
 
+    def set_data_array(self, array):
+        """ Sets all data for the parameter at once. array is a numpy array (typically a column view of the data block) """
+        self._data = array
+
+    def set_data_loader(self, loader):
+        """ loader is called (without arguments) the first time data is accessed. Used for lazy loading. """
+        self._data_loader = loader
+
     @property
     def data(self):
+        if self._data_loader:
+            loader = self._data_loader
+            self._data_loader = None
+            loader()
         return self._data
 
     @data.setter
     def data(self, data):
+        self._data_loader = None
         self._data = data
 
     def change_name(self, new_name):
         self.info['name'] = new_name
 
+    def set_missing_value(self, missing_value, missing_value_str):
+        """ Values equal to missing_value are written as missing_value_str """
+        self._missing_value = missing_value
+        self._missing_value_str = missing_value_str
+
     def get_value_as_string_for_index(self, index):
-        if type(self.data[index]) == str:
-            return self.data[index].rjust(self._tot_value_length)
-        return '{:{}}'.format(self.data[index], self.get_format(self.data[index]))
+        value = self.data[index]
+        if self._missing_value_str is not None and value == self._missing_value:
+            value = self._missing_value_str
+        if type(value) == str:
+            return value.rjust(self._tot_value_length)
+        form = self.get_format(value)
+        if form.endswith('d'):
+            # Data stored in a float array
+            value = int(value)
+        return '{:{}}'.format(value, form)
+
+    def get_data_as_strings(self, start=None, stop=None):
+        """
+        Returns the values in the column as formatted strings. Rows are selected with start and stop as in a slice.
+        The format is resolved once for the column instead of once per value as in get_value_as_string_for_index.
+        """
+        data = self.data
+        if not isinstance(data, np.ndarray):
+            return [self.get_value_as_string_for_index(i) for i in range(len(data))[start:stop]]
+        data = data[start:stop]
+        form = self.get_format()
+        values = data
+        if form.endswith('d'):
+            # Data stored in a float array
+            values = values.astype(np.int64)
+        strings = list(map(f'{{:{form}}}'.format, values.tolist()))
+        if not self.use_value_format and self._nr_decimals is not None and self._value_format == 'e':
+            # Negative values in exponential format are written with one decimal less
+            negative_form = f'{{:{self.get_format(-1)}}}'
+            for i in np.flatnonzero(data < 0).tolist():
+                strings[i] = negative_form.format(values[i])
+        if self._missing_value_str is not None:
+            missing_string = self._missing_value_str.rjust(self._tot_value_length)
+            for i in np.flatnonzero(data == self._missing_value).tolist():
+                strings[i] = missing_string
+        return strings
 
     def set_active(self, is_active):
         self.active = is_active
@@ -250,13 +400,25 @@ class ModifyCnv(CnvFile):
     missing_value = -9.990e-29
     missing_value_str = '-9.990e-29'
     g = 9.818  # g vid 60 gr nord (dblg)
+    stream_chunk_size = 10000
+    _channel_pattern = re.compile('Channel="([^"]*)"')
 
     def __init__(self, *args, **kwargs):
         self._station = kwargs.pop('station', None)
+        # In stream mode all lines are not kept in memory. Data rows are formatted and written in chunks in save_file.
+        self._stream = kwargs.pop('stream', False)
+        # Additional rules (header_rules.HeaderRule) applied to the header after the standard modifications
+        self._header_rules = list(kwargs.pop('header_rules', []))
         self._use_value_format = kwargs.pop('use_value_format', True)
+        # In lazy mode only the header is read at init. Data is read the first time it is accessed.
+        self._lazy = kwargs.pop('lazy', False)
+        self._data_is_loaded = False
         self._value_format_object = ValueFormat(value_format_path=kwargs.pop('value_format_path', None))
         super().__init__(*args, **kwargs)
 
+    def add_header_rule(self, rule):
+        self._header_rules.append(rule)
+
     def modify(self):
         self._validate()
         self._modify()
@@ -266,18 +428,27 @@ class ModifyCnv(CnvFile):
             raise InvalidFileToModify
 
     def _modify(self):
+        self._load_data()
         self._save_columns()
         # self._check_index()
         self._header_lines = self.header.lines[:]
         # self._data_lines = self.data_lines[:]
 
-        self._modify_header_information()
-        self._modify_irradiance()
-        self._modify_fluorescence()
-        self._modify_depth()
-        self._modify_station()
+        # All header changes are collected as rules and applied in one pass over the header
+        rules = header_rules.HeaderRules()
+        rules.add_rules(self._get_header_information_rules())
+        rules.add_rules(self._get_irradiance_rules())
+        chl_rule, phyc_rule = self._get_fluorescence_rules()
+        rules.add_rules([chl_rule, phyc_rule])
+        rules.add_rules(self._modify_depth())
+        rules.add_rules(self._get_station_rules())
+        rules.add_rules(self._header_rules)
+        self._header_lines = rules.apply(self._header_lines)
 
-        self._set_lines()
+        self._modify_fluorescence(chl_rule, phyc_rule)
+
+        if not self._stream:
+            self._set_lines()
 
     def _save_info_from_file(self):
         self._header_form = {'info': []}
@@ -288,11 +459,13 @@ class ModifyCnv(CnvFile):
         self._header_cruise_info = {}
 
         self.xml_lines = ['<?xml version="1.0" encoding="UTF-8"?>\n']
-        print('print(len(self.xml_lines))', len(self.xml_lines))
+        logger.debug(f'Reading header: {self.path}')
         is_xml = False
+        # Comment (line after the sensor tag) for each channel in the xml part of the header
+        self._channel_comments = {}
+        self._sensor_table = None
+        comment_channel = None
 
-        header = True
-        has_set_value_length = False
         with open(self.path) as fid:
             for line in fid:
                 strip_line = line.strip()
@@ -301,7 +474,7 @@ class ModifyCnv(CnvFile):
                 if line.startswith('* System UTC'):
                     self._header_datetime = datetime.datetime.strptime(line.split('=')[1].strip(), self.header_date_format)
                 elif line.startswith('* NMEA Latitude'):
-                    print(self.path)
+                    logger.debug(f'NMEA position in header: {self.path}')
                     self._header_lat = line.split('=')[1].strip()[:-1].replace(' ', '')
                 elif line.startswith('* NMEA Longitude'):
                     self._header_lon = line.split('=')[1].strip()[:-1].replace(' ', '')
@@ -336,40 +509,121 @@ class ModifyCnv(CnvFile):
                 if line.startswith('# <Sensors count'):
                     is_xml = True
                 if is_xml:
-                    self.xml_lines.append(line[2:])
+                    xml_line = line[2:]
+                    self.xml_lines.append(xml_line)
+                    if comment_channel is not None:
+                        self._channel_comments.setdefault(comment_channel, xml_line.split(',', 1)[-1][:-4].strip())
+                    channel_match = self._channel_pattern.search(xml_line)
+                    comment_channel = channel_match.group(1) if channel_match else None
                 if line.startswith('# </Sensors>'):
                     is_xml = False
                     self._xml_tree = xmlcon_parser.get_parser_from_string(''.join(self.xml_lines))
                     self._sensor_info = xmlcon_parser.get_sensor_info(self._xml_tree)
 
+                self.header.add_line(line)
                 if '*END*' in line:
-                    self.header.add_line(line)
-                    header = False
-                    continue
-                if header:
-                    self.header.add_line(line)
-                else:
-                    if not line.strip():
-                        continue
-                    self._nr_data_lines += 1
-                    split_line = strip_line.split()
-                    if not has_set_value_length:
-                        tot_len = len(line.rstrip())
-                        value_length = tot_len / len(split_line)
-                        int_value_lenght = int(value_length)
-                        if int_value_lenght != value_length:
-                            print(self.path)
-                            raise ValueError('Something is wrong in the file!')
-                        for i, value in enumerate(split_line):
-                            self._parameters[i].set_value_length(int_value_lenght)
-                        has_set_value_length = True
-                    for i, value in enumerate(split_line):
-                        self._parameters[i].add_data(value)
+                    break
+            if self._lazy:
+                for par in self._parameters.values():
+                    par.set_data_loader(self._load_data)
+                return
+        self._data_is_loaded = True
+        self._read_data()
 
-    def get_sensor_info(self):
-        index = {}
-        sensor_list = []
-        for i, sensor in enumerate(self._xml_tree.findall('sensor')):
+    def _load_data(self):
+        """ Reads the data section of the file if not already done (lazy mode) """
+        if self._data_is_loaded:
+            return
+        self._data_is_loaded = True
+        for par in self._parameters.values():
+            par.set_data_loader(None)
+        self._read_data()
+
+    def _read_data(self):
+        """
+        Reads the data section through a memory map (CnvDataReader). The data section is read as text if the rows do
+        not have fixed record length or the values are not within their fields.
+        """
+        try:
+            reader = CnvDataReader(self.path)
+        except ValueError:
+            reader = None
+        if reader:
+            with reader:
+                strings = reader.get_strings()
+                if reader.nr_rows and is_fixed_width(get_chars(strings)):
+                    self._save_data_strings(strings, reader.value_length)
+                    del strings
+                    return
+                del strings
+        with open(self.path) as fid:
+            for line in fid:
+                if '*END*' in line:
+                    break
+            data_block = fid.read()
+        self._save_data_block(data_block)
+
+    def _save_data_block(self, data_block):
+        """
+        Parses all data rows in the data block (string). Data is stored in self._data_array (one float64 array) and
+        each parameter holds a view of its column.
+        """
+        self._nr_data_lines = 0
+        self._data_array = np.empty((0, len(self._parameters)))
+        rows = [line.rstrip() for line in data_block.splitlines() if line.strip()]
+        if not rows:
+            return
+        nr_columns = len(rows[0].split())
+        value_length = len(rows[0]) / nr_columns
+        if int(value_length) != value_length:
+            raise ValueError(f'Something is wrong in the file! Not fixed width in data section: {self.path}')
+        value_length = int(value_length)
+
+        strings = None
+        if all(len(row) == nr_columns * value_length for row in rows) and data_block.isascii():
+            raw = ''.join(rows).encode('ascii')
+            strings = np.frombuffer(raw, dtype=f'S{value_length}').reshape(len(rows), nr_columns)
+            if not is_fixed_width(get_chars(strings)):
+                strings = None
+        del rows
+        if strings is None:
+            # Values are not strictly in their fields. Read value by value.
+            values = data_block.split()
+            if len(values) % nr_columns:
+                raise ValueError(f'Something is wrong in the file! Number of values in data section does not match '
+                                 f'the number of columns: {self.path}')
+            try:
+                strings = np.array(values, dtype=bytes).reshape(-1, nr_columns)
+            except UnicodeEncodeError as e:
+                raise ValueError(f'Something is wrong in the file! Invalid characters in data section: '
+                                 f'{self.path}') from e
+        self._save_data_strings(strings, value_length)
+
+    def _save_data_strings(self, strings, value_length):
+        """ strings is a 2D numpy array (rows, columns) of byte strings. Columns are converted one by one. """
+        nr_rows, nr_columns = strings.shape
+        chars = get_chars(strings)
+        self._data_array = np.empty((nr_rows, nr_columns))
+        for i in range(nr_columns):
+            try:
+                self._data_array[:, i] = strings[:, i].astype(np.float64)
+            except ValueError as e:
+                raise ValueError(f'Something is wrong in the file! Could not read values in column {i}: '
+                                 f'{self.path}') from e
+            self._parameters[i].set_value_length(value_length)
+            self._parameters[i].set_value_format(*get_value_format(chars[:, i]))
+            self._parameters[i].set_data_array(self._data_array[:, i])
+        self._nr_data_lines = nr_rows
+
+    def _get_sensor_table(self):
+        """
+        Returns a list with information about all sensors in the xml part of the header.
+        The table is created once and is used for all sensor information requests.
+        """
+        if self._sensor_table is not None:
+            return self._sensor_table
+        sensor_table = []
+        for sensor in self._xml_tree.findall('sensor'):
             child_list = sensor.getchildren()
             if not child_list:
                 continue
@@ -378,20 +632,20 @@ class ModifyCnv(CnvFile):
             nr = child.find('SerialNumber').text
             calibration_date = child.find('CalibrationDate').text
             if calibration_date:
-                # print('calibration_date', calibration_date, par)
                 calibration_date = self.get_datetime_object(calibration_date)
             if nr is None:
                 nr = ''
-            index.setdefault(par, [])
-            index[par].append(i)
             channel = int(sensor.attrib['Channel'])
-            data = {'channel': channel,
-                    'internal_parameter': par,
-                    'serial_number': nr,
-                    'calibration_date': calibration_date,
-                    'parameter': self._get_comment_for_channel(channel)}
-            sensor_list.append(data)
-        return sensor_list
+            sensor_table.append({'channel': channel,
+                                 'internal_parameter': par,
+                                 'serial_number': nr,
+                                 'calibration_date': calibration_date,
+                                 'parameter': self._get_comment_for_channel(channel)})
+        self._sensor_table = sensor_table
+        return self._sensor_table
+
+    def get_sensor_info(self):
+        return [dict(data) for data in self._get_sensor_table()]
 
     @staticmethod
     def get_datetime_object(date_str):
@@ -412,12 +666,7 @@ class ModifyCnv(CnvFile):
         return datetime.datetime.strptime(date_str, format_str)
 
     def _get_comment_for_channel(self, channel):
-        channel_str = f'Channel="{channel}"'
-        for row1, row2 in zip(self.xml_lines[:-1], self.xml_lines[1:]):
-            if channel_str not in row1:
-                continue
-            comment = row2.split(',', 1)[-1][:-4].strip()
-            return comment
+        return self._channel_comments.get(str(channel))
 
     def _save_columns(self):
         self.col_pres = None
@@ -458,12 +707,13 @@ class ModifyCnv(CnvFile):
 
     @property
     def density_data(self):
+        self._load_data()
         if self._parameters[self.col_dens].active:
             return self._parameters[self.col_dens].data
         elif self._parameters[self.col_dens2].active:
             return self._parameters[self.col_dens2].data
         else:
-            return [ModifyCnv.missing_value]*self._nr_data_lines
+            return np.full(self._nr_data_lines, ModifyCnv.missing_value)
 
     @property
     def header_lines(self):
@@ -471,15 +721,18 @@ class ModifyCnv(CnvFile):
 
     @property
     def data_lines(self):
-        data_rows = []
-        for r in range(self._nr_data_lines):
-            line_list = []
-            for par, obj in self.parameters.items():
-                value = obj.get_value_as_string_for_index(r)
-                line_list.append(value)
-            line_string = ''.join(line_list)
-            data_rows.append(line_string)
-        return data_rows
+        self._load_data()
+        columns = [obj.get_data_as_strings() for obj in self.parameters.values()]
+        return list(map(''.join, zip(*columns)))
+
+    def iter_data_lines(self, chunk_size=None):
+        """ Yields the data rows in lists of at most chunk_size rows """
+        self._load_data()
+        chunk_size = chunk_size or self.stream_chunk_size
+        for start in range(0, self._nr_data_lines, chunk_size):
+            stop = start + chunk_size
+            columns = [obj.get_data_as_strings(start, stop) for obj in self.parameters.values()]
+            yield list(map(''.join, zip(*columns)))
 
     @property
     def sensor_info(self):
@@ -524,102 +777,113 @@ class ModifyCnv(CnvFile):
 
         self.lines = all_lines
 
-    def _modify_header_information(self):
+    def save_file(self, directory=None, overwrite=False, **kwargs):
+        if not self._stream:
+            return super().save_file(directory, overwrite=overwrite, **kwargs)
+        return self._save_file_stream(directory, overwrite=overwrite)
+
+    def _save_file_stream(self, directory, overwrite=False):
+        """
+        Writes the modified header followed by the data rows in chunks. Gives the same result as writing self.lines.
+        The file is written to a temporary file in the target directory and then renamed, so a crash never leaves a
+        half written file at the target path.
+        """
+        target_path = pathlib.Path(self.get_proper_path(directory))
+        if target_path.exists() and not overwrite:
+            raise FileExistsError(target_path)
+        temp_path = pathlib.Path(target_path.parent, f'.{target_path.name}.{os.getpid()}.tmp')
+        try:
+            with open(temp_path, 'w') as fid:
+                for line in self._header_lines:
+                    fid.write(line + '\n')
+                for chunk in self.iter_data_lines():
+                    fid.write('\n'.join(chunk) + '\n')
+            os.replace(temp_path, target_path)
+        except BaseException:
+            if temp_path.exists():
+                os.remove(temp_path)
+            raise
+        return target_path
+
+    def _get_header_information_rules(self):
         svMean = self._get_mean_sound_velocity()
         now = time.strftime("%a, %d %b %Y %H:%M:%S +0000", time.gmtime())
-        after_str = '** Ship'
-        rows_to_insert = [f'** Average sound velocity: {str("%6.2f" % svMean)} m/s',
-                          f'** True-depth calculation: {now}',
-                          # f'** CTD Python Module SMHI /ver 3-12/ feb 2012',
-                          # f'** Python Module: ctd_processing, nov 2020'
-                          # f'** LIMS Job: {self.year}{self.ctry}{self.ship}-{self.serie}'
-                          ]
-        for row in rows_to_insert:
-            if 'True-depth calculation' in row:
-                if self.string_match_header_form('True-depth calculation'):
-                    continue
-                Header.insert_row_after(self._header_lines, row, after_str)
-            else:
-                Header.insert_row_after(self._header_lines, row, after_str)
-            after_str = row
-
-    def _modify_irradiance(self):
-        Header.append_to_row(self._header_lines, 'par: PAR/Irradiance', ' [µE/(cm^2*s)]')
-
-    def _modify_fluorescence(self):
+        rows_to_insert = [f'** Average sound velocity: {str("%6.2f" % svMean)} m/s']
+        if not self.string_match_header_form('True-depth calculation'):
+            rows_to_insert.append(f'** True-depth calculation: {now}')
+        # f'** CTD Python Module SMHI /ver 3-12/ feb 2012',
+        # f'** Python Module: ctd_processing, nov 2020'
+        # f'** LIMS Job: {self.year}{self.ctry}{self.ship}-{self.serie}'
+        return [header_rules.InsertRowsAfter('** Ship', rows_to_insert)]
+
+    def _get_irradiance_rules(self):
+        return [header_rules.AppendToRow('par: PAR/Irradiance', ' [µE/(cm^2*s)]')]
+
+    def _get_fluorescence_rules(self):
         # Lägger till Chl-a på de fluorometrar som har beteckning som börjar på FLNTURT
+        chl_rule = header_rules.ConditionalRules(
+            header_rules.RowOffsetCondition('Fluorometer, WET Labs ECO-AFL/FL -->', 2, '<SerialNumber>FLNTURT'),
+            [header_rules.ReplaceInRows('Fluorometer, WET Labs ECO-AFL/FL -->', 'Fluorometer', 'Chl-a Fluorometer'),
+             header_rules.ReplaceInRows('Fluorescence, WET Labs ECO-AFL/FL [mg/m^3]', 'Fluorescence',
+                                        'Chl-a Fluorescence')])
+        phyc_rule = header_rules.ConditionalRules(
+            header_rules.RowOffsetCondition('Fluorometer, WET Labs ECO-AFL/FL, 2 -->', 2, '<SerialNumber>FLPCRTD'),
+            [header_rules.ReplaceInRows('Fluorometer, WET Labs ECO-AFL/FL, 2 -->', 'Fluorometer',
+                                        'Phycocyanin Fluorometer'),
+             header_rules.ReplaceInRows('Fluorescence, WET Labs ECO-AFL/FL, 2 [mg/m^3]', 'Fluorescence',
+                                        'Phycocyanin Fluorescence')])
+        return chl_rule, phyc_rule
+
+    def _modify_fluorescence(self, chl_rule, phyc_rule):
+        """ Changes parameter names if the fluorescence header rules have been applied """
         par_name_1 = self._get_parameter_name_matching_string('Fluorescence, WET Labs ECO-AFL/FL [mg/m^3]')
-        fluo_index_1 = Header.get_row_index_for_matching_string(self._header_lines,
-                                                                'Fluorescence, WET Labs ECO-AFL/FL [mg/m^3]')
-        fluo_xml_index_1 = Header.get_row_index_for_matching_string(self._header_lines,
-                                                                    'Fluorometer, WET Labs ECO-AFL/FL -->')
-        serial_index_1 = Header.get_row_index_for_matching_string(self._header_lines, '<SerialNumber>FLNTURT',
-                                                                  as_list=True)
-
         par_name_2 = self._get_parameter_name_matching_string('Fluorescence, WET Labs ECO-AFL/FL, 2 [mg/m^3]')
-        fluo_index_2 = Header.get_row_index_for_matching_string(self._header_lines,
-                                                                'Fluorescence, WET Labs ECO-AFL/FL, 2 [mg/m^3]')
-        fluo_xml_index_2 = Header.get_row_index_for_matching_string(self._header_lines,
-                                                                    'Fluorometer, WET Labs ECO-AFL/FL, 2 -->')
-        serial_index_2 = Header.get_row_index_for_matching_string(self._header_lines, '<SerialNumber>FLPCRTD',
-                                                                  as_list=True)
-
-        if fluo_xml_index_1 and (fluo_xml_index_1 + 2) in serial_index_1:
-            Header.replace_string_at_index(self._header_lines, fluo_xml_index_1, 'Fluorometer', 'Chl-a Fluorometer')
-            Header.replace_string_at_index(self._header_lines, fluo_index_1, 'Fluorescence', 'Chl-a Fluorescence')
+
+        if chl_rule.applied:
             new_par_name_1 = par_name_1.replace('Fluorescence', 'Chl-a Fluorescence')
             self._change_parameter_name(par_name_1, new_par_name_1)
 
-        if fluo_xml_index_2 and (fluo_xml_index_2 + 2) in serial_index_2:
+        if phyc_rule.applied:
             if not par_name_2:
                 raise Exception(
-                    f'Fluorometer parameter finns i xml-delen ({fluo_xml_index_2}) men inte i parameterlistan. Kan vara missmatch mellan DataCnv och xmlcon: \n{self.path}')
-            Header.replace_string_at_index(self._header_lines, fluo_xml_index_2, 'Fluorometer',
-                                           'Phycocyanin Fluorometer')
-            Header.replace_string_at_index(self._header_lines, fluo_index_2, 'Fluorescence', 'Phycocyanin Fluorescence')
+                    f'Fluorometer parameter finns i xml-delen men inte i parameterlistan. Kan vara missmatch mellan DataCnv och xmlcon: \n{self.path}')
             new_par_name_2 = par_name_2.replace('Fluorescence', 'Phycocyanin Fluorescence')
             self._change_parameter_name(par_name_2, new_par_name_2)
 
     def _modify_depth(self):
-        index = Header.get_row_index_for_matching_string(self._header_lines, 'depFM: Depth [fresh water, m]')
-        Header.replace_string_at_index(self._header_lines, index, 'fresh water', 'true depth')
+        """ Replaces data in the depth column with true depth. Returns the header rules for the depth column """
         par_name = self._get_parameter_name_matching_string('depFM: Depth [fresh water, m]')
         if par_name:
             new_par_name = par_name.replace('fresh water', 'true depth')
             self._change_parameter_name(par_name, new_par_name)
 
-        span_depth_index = Header.get_row_index_for_matching_string(self._header_lines,
-                                                                    f'# span {self.col_depth}')
         true_depth_values = self._get_calculated_true_depth()
         if int(self.col_depth) < 10:
             new_line = '# span %s =%11.3f,%11.3f%7s' % (
-            self.col_depth, min(true_depth_values), max(true_depth_values), '')
+            self.col_depth, true_depth_values.min(), true_depth_values.max(), '')
         else:
             new_line = '# span %s =%11.3f,%11.3f%6s' % (
-            self.col_depth, min(true_depth_values), max(true_depth_values), '')
-        Header.replace_row(self._header_lines, span_depth_index, new_line)
+            self.col_depth, true_depth_values.min(), true_depth_values.max(), '')
 
         # Ersätt data i fresh water kolumnen med true depth avrundar true depth till tre decimaler
-        new_depth_data = []
-        for value in true_depth_values:
-            if value == self.missing_value:
-                new_depth_data.append(self.missing_value_str)
-                # new_depth_data.append(self.missing_value)
-            else:
-                new_depth_data.append(round(value, 3))
+        # Python round is used since np.round may differ in the last decimal
+        new_depth_data = np.array([round(value, 3) for value in true_depth_values.tolist()])
+        new_depth_data[true_depth_values == self.missing_value] = self.missing_value
         self.parameters[self.col_depth].data = new_depth_data
+        self.parameters[self.col_depth].set_missing_value(self.missing_value, self.missing_value_str)
+
+        return [header_rules.ReplaceInRows('depFM: Depth [fresh water, m]', 'fresh water', 'true depth'),
+                header_rules.ReplaceRow(f'# span {self.col_depth} =', new_line)]
 
-    def _modify_station(self):
+    def _get_station_rules(self):
         logger.debug(f'_modify_station: {self._station}')
         if not self._station:
-            return
+            return []
         if self._station == self._header_station:
             logger.info(f'Given station "{self._header_station}" name is ths same as in header in file: {self.path}')
-            return
-        index = Header.get_row_index_for_matching_string(self._header_lines, 'station', ignore_case=True)
-        Header.replace_string_at_index(self._header_lines, index, self._header_station, self._station,
-                                       ignore_if_present=False)
-        logger.error(f'{self._header_lines[index]=}')
+            return []
+        return [header_rules.ReplaceInRows('station', self._header_station, self._station,
+                                           ignore_if_present=False, ignore_case=True)]
 
     def _get_mean_sound_velocity(self):
         svCM_data = self.sound_velocity_data
@@ -639,38 +903,27 @@ class ModifyCnv(CnvFile):
                 par.change_name(new_name)
 
     def _get_calculated_true_depth(self):
-        prdM_data = self.pressure_data
-        sigT_data = self.density_data
-
-        # Beräkning av truedepth # Ersätt depFM med true depth i headern
-        # Start params
-        dens_0 = (sigT_data[0] + 1000.) / 1000.  # ' start densitet
-        p_0 = 0
-        depth = 0
-        true_depth = []
-        for q in range(len(prdM_data)):
-            if sigT_data[q] != self.missing_value:
-                # decibar till bar (dblRPres)
-                rpres = prdM_data[q] * 10.
-                # Beräknar densitet (dblDens)
-                dens = (sigT_data[q] + 1000.) / 1000.
-                # Beräknar delta djup (dblDDjup)
-                ddepth = (rpres - p_0) / ((dens + dens_0) / 2. * self.g)
-                # Summerar alla djup och använd framräknande trycket i nästa loop
-                # Om det är första (ej helt relevant kanske) eller sista värdet dela med två enl. trappetsmetoden
-                dens_0 = dens
-                #    if q == 0 or q == (len(prdM)-1):
-                #        Depth = Depth + DDepth / 2.
-                #    else:
-                #        Depth = Depth + DDepth
-                # Ändrad av Örjan 2015-02-10 /2. första och sista djupet borttaget.
-                depth = depth + ddepth
-                # Spara framräknat djup för nästa loop
-                p_0 = rpres
-                # Sparar undan TrueDepth
-                true_depth.append(depth)
-            else:
-                true_depth.append(self.missing_value)
+        """
+        Calculates true depth from pressure and density (sigma-t) with the trapezoidal method. Returns a numpy array.
+        Rows where density is missing are set to self.missing_value and are skipped in the integration
+        (previous pressure and density are used for the next valid row).
+        """
+        prdM_data = np.asarray(self.pressure_data, dtype=np.float64)
+        sigT_data = np.asarray(self.density_data, dtype=np.float64)
+
+        true_depth = np.full(len(prdM_data), self.missing_value)
+        if not len(prdM_data):
+            return true_depth
+        valid = sigT_data != self.missing_value
+        # decibar till bar (dblRPres) och densitet (dblDens) för giltiga rader
+        rpres = prdM_data[valid] * 10.
+        dens = (sigT_data[valid] + 1000.) / 1000.
+        # Föregående giltiga värden. Start: tryck 0 och densitet från första raden
+        p_0 = np.concatenate(([0.], rpres[:-1]))
+        dens_0 = np.concatenate(([(sigT_data[0] + 1000.) / 1000.], dens[:-1]))
+        # Delta djup (dblDDjup) summeras i samma ordning som i loopen
+        ddepth = (rpres - p_0) / ((dens + dens_0) / 2. * self.g)
+        true_depth[valid] = np.cumsum(ddepth)
         return true_depth
 
     # def _check_index(self):
@@ -704,7 +957,8 @@ class ModifyCnv(CnvFile):
 
 
 def modify_cnv_down_file(package, directory=None, overwrite=False):
-    file = ModifyCnv(package.get_file(prefix='d', suffix='.cnv').path, station=package('station', pref_suffix='.hdr'))
+    file = ModifyCnv(package.get_file(prefix='d', suffix='.cnv').path, station=package('station', pref_suffix='.hdr'),
+                     stream=True)
     file.key = package.key
     try:
         file.modify()
@@ -0,0 +1,85 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import pathlib
+
+logger = logging.getLogger(__name__)
+
+
+def get_file_hash(path, chunk_size=1024*1024):
+    """ Returns the sha256 hex digest of the file content """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as fid:
+        for chunk in iter(lambda: fid.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def get_output_info(path):
+    """ Outputs are identified by size and modification time (no need to read them) """
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+class ProcessingManifest:
+    """
+    Manifest for one processed package. Holds a hash for each input file (raw files and psa files), the processing
+    options and the output files created from them. Used to skip processing of casts that are unchanged since the last
+    run.
+    """
+
+    def __init__(self, path):
+        self._path = pathlib.Path(path)
+        self._data = {}
+        if self._path.exists():
+            self._load()
+
+    def __str__(self):
+        return f'ProcessingManifest: {self._path}'
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def inputs(self):
+        return self._data.get('inputs', {})
+
+    @property
+    def outputs(self):
+        return self._data.get('outputs', {})
+
+    def _load(self):
+        try:
+            with open(self._path) as fid:
+                self._data = json.load(fid)
+        except (OSError, ValueError):
+            logger.warning(f'Could not read manifest: {self._path}')
+            self._data = {}
+
+    @staticmethod
+    def get_inputs(raw_paths, psa_paths, options):
+        return {'raw': {pathlib.Path(path).name: get_file_hash(path) for path in raw_paths},
+                'psa': {pathlib.Path(path).name: get_file_hash(path) for path in psa_paths},
+                'options': {key: str(value) for key, value in options.items()}}
+
+    def is_unchanged(self, inputs):
+        """ True if inputs are the same as in the manifest and all outputs are still the same """
+        if not self._data or inputs != self.inputs:
+            return False
+        for path, info in self.outputs.items():
+            if not os.path.exists(path) or get_output_info(path) != info:
+                return False
+        return True
+
+    def save(self, inputs, output_paths):
+        self._data = {'created': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                      'inputs': inputs,
+                      'outputs': {str(path): get_output_info(path) for path in output_paths}}
+        os.makedirs(self._path.parent, exist_ok=True)
+        temp_path = pathlib.Path(self._path.parent, f'.{self._path.name}.{os.getpid()}.tmp')
+        with open(temp_path, 'w') as fid:
+            json.dump(self._data, fid, indent=4)
+        os.replace(temp_path, self._path)
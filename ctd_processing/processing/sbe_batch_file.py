@@ -1,18 +1,150 @@
+import logging
+import pathlib
+import re
+import shutil
 import subprocess
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def parse_setup_line(line):
+    """
+    Parses a line in the sbebatch setup file, ex: "datcnv /p<psa path> /i<input path> /c<config path> /o%1".
+    Returns the module name and a dict with the arguments (key is the flag letter).
+    """
+    module, _, arg_str = line.strip().partition(' ')
+    args = {}
+    for match in re.finditer(r'(?:^|\s)/([a-zA-Z])(.*?)(?=\s/[a-zA-Z]|$)', arg_str.strip()):
+        args[match.group(1).lower()] = match.group(2).strip()
+    return module.lower(), args
+
+
+class SBEBatchExecutor:
+    """
+    Base class for running the SBE processing modules listed in the setup file.
+    run returns a dict with wall time in seconds for each module (or for the whole batch if not possible to time
+    modules separately).
+    """
+
+    def run(self, batch_file):
+        """ batch_file is a SBEBatchFile object """
+        raise NotImplementedError
+
+    @staticmethod
+    def _get_setup_lines(batch_file):
+        with open(batch_file.setup_path, encoding='cp1252') as fid:
+            return [line.strip() for line in fid if line.strip()]
+
+
+class WindowsBatchExecutor(SBEBatchExecutor):
+    """
+    Runs the modules with sbebatch.exe (SBE Data Processing). Windows only.
+    Default is to run the batch file created by SBEBatchFile once. Timing is then reported for the whole batch as
+    "sbebatch". With per_module=True sbebatch.exe is called once for each line in the setup file and each module is
+    timed separately.
+    """
+
+    def __init__(self, per_module=False):
+        self.per_module = per_module
+
+    def run(self, batch_file):
+        if not batch_file.batch_path.exists():
+            raise FileNotFoundError(f'Batch file not found: {batch_file.batch_path}')
+        if not self.per_module:
+            t0 = time.perf_counter()
+            subprocess.run(str(batch_file.batch_path))
+            return {'sbebatch': time.perf_counter() - t0}
+        timings = {}
+        for i, line in enumerate(self._get_setup_lines(batch_file)):
+            module, _ = parse_setup_line(line)
+            setup_path = pathlib.Path(batch_file.output_directory, f'ctdmodule_{i}_{module}.txt')
+            with open(setup_path, 'w', encoding='cp1252') as fid:
+                fid.write(line)
+            t0 = time.perf_counter()
+            subprocess.run(['sbebatch.exe', str(setup_path), str(batch_file.output_directory)])
+            timings[module] = timings.get(module, 0) + time.perf_counter() - t0
+        return timings
+
+
+class LocalBatchExecutor(SBEBatchExecutor):
+    """
+    Stand in for sbebatch.exe that runs on any platform. Useful for testing and profiling the rest of the processing.
+    Each module in the setup file is run with engine(module, args, output_directory) if given. Otherwise the output
+    files for the module are copied from fixture_directory. Files are first looked for in
+    <fixture_directory>/<module> and then in fixture_directory. Missing files for a module are ignored.
+    """
+
+    def __init__(self, fixture_directory=None, engine=None):
+        if not fixture_directory and not engine:
+            raise AttributeError('fixture_directory or engine must be given')
+        self.fixture_directory = pathlib.Path(fixture_directory) if fixture_directory else None
+        self.engine = engine
+
+    def run(self, batch_file):
+        timings = {}
+        for line in self._get_setup_lines(batch_file):
+            module, args = parse_setup_line(line)
+            t0 = time.perf_counter()
+            if self.engine:
+                self.engine(module, args, batch_file.output_directory)
+            else:
+                self._copy_fixture_files(module, args, batch_file.output_directory)
+            timings[module] = timings.get(module, 0) + time.perf_counter() - t0
+        return timings
+
+    @staticmethod
+    def _get_output_names(module, args):
+        stem = pathlib.Path(args.get('i', '')).stem
+        if module == 'datcnv':
+            return [f'{stem}.cnv', f'{stem}.ros']
+        if module == 'bottlesum':
+            return [f'{stem}.btl']
+        if module == 'split':
+            return [f'd{stem}.cnv', f'u{stem}.cnv']
+        return [f'{stem}.cnv']
+
+    def _copy_fixture_files(self, module, args, output_directory):
+        for name in self._get_output_names(module, args):
+            for directory in [pathlib.Path(self.fixture_directory, module), self.fixture_directory]:
+                source = pathlib.Path(directory, name)
+                if source.exists():
+                    shutil.copy2(source, pathlib.Path(output_directory, name))
+                    break
+            else:
+                logger.debug(f'No fixture file for module {module}: {name}')
+
 
 class SBEBatchFile:
-    def __init__(self, file_handler=None, processing_paths=None):
+    def __init__(self, file_handler=None, processing_paths=None, executor=None):
         """
         :param file_paths: SBEProsessingPaths
+        :param executor: SBEBatchExecutor. Default is WindowsBatchExecutor
         """
         self._file_handler = file_handler
         self._processing_paths = processing_paths
+        self._executor = executor or WindowsBatchExecutor()
+        self.timings = {}
+
+    @property
+    def batch_path(self):
+        return self._processing_paths('file_batch')
+
+    @property
+    def setup_path(self):
+        return self._processing_paths('file_setup')
+
+    @property
+    def output_directory(self):
+        return self._processing_paths.working_directory
 
     def create_file(self):
-        with open(self._processing_paths('file_batch'), 'w') as fid:
-            fid.write(f"sbebatch.exe {self._processing_paths('file_setup')} {self._file_handler('local', 'temp')}")
+        with open(self.batch_path, 'w') as fid:
+            fid.write(f"sbebatch.exe {self.setup_path} {self.output_directory}")
 
     def run_file(self):
-        if not self._processing_paths('file_batch').exists():
-            raise FileNotFoundError(f"Batch file not found: {self._processing_paths('file_batch')}")
-        subprocess.run(str(self._processing_paths('file_batch')))
\ No newline at end of file
+        """ Runs the modules in the setup file. Returns a dict with wall time in seconds for each module """
+        self.timings = self._executor.run(self)
+        for module, seconds in self.timings.items():
+            logger.info(f'{module}: {seconds:.2f} s')
+        return self.timings
@@ -1,3 +1,4 @@
+import concurrent.futures
 import logging
 import os
 import pathlib
@@ -12,11 +13,13 @@ from file_explorer import psa
 from file_explorer.file_handler.seabird_ctd import get_seabird_file_handler, SBEFileHandler
 
 from ctd_processing import asvp_file
+from ctd_processing import directory_index
 from ctd_processing import delivery_note
 from ctd_processing import metadata
 from ctd_processing import modify_cnv
 from ctd_processing import sensor_info
 from ctd_processing import standard_format
+from ctd_processing.processing.processing_manifest import ProcessingManifest
 from ctd_processing.processing.sbe_batch_file import SBEBatchFile
 from ctd_processing.processing.sbe_processing_paths import SBEProcessingPaths
 from ctd_processing.processing.sbe_setup_file import SBESetupFile
@@ -35,6 +38,12 @@ class SBEProcessing:
         self._overwrite = False
         self._package = None
         self._old_key = kwargs.get('old_key', False)
+        self._job_id = kwargs.get('job_id')
+        self._keep_job_directory = kwargs.get('keep_job_directory', False)
+        self._batch_executor = kwargs.get('batch_executor')
+        self._tau_state = None
+        self._surfacesoak = None
+        self.module_timings = {}
 
     @property
     def platform(self):
@@ -82,6 +91,7 @@ class SBEProcessing:
         for key, path in options.items():
             if name in key.lower():
                 self._processing_paths.set_loopedit(path)
+                self._surfacesoak = key
                 return (key, path)
         else:
             raise Exception('Invalid surfacesoak option')
@@ -90,7 +100,13 @@ class SBEProcessing:
         return psa.DerivePSAfile(self._processing_paths('psa_derive'))
 
     def set_tau_state(self, state):
-        self._get_derive_psa_obj().set_tau_correction(bool(state))
+        """ Tau correction is set in the derive psa file (the copy in the job directory) when the process is run """
+        self._tau_state = bool(state)
+
+    def _apply_tau_state(self):
+        if self._tau_state is None:
+            return
+        self._get_derive_psa_obj().set_tau_correction(self._tau_state)
 
     def select_file(self, file_path):
         """ Kontrollen för att skriva över bör göras mot raw-mappen istället för mot tempmappen. """
@@ -108,6 +124,9 @@ class SBEProcessing:
         path = pathlib.Path(file_path)
         if not path.samefile(self._file_path):
             raise PermissionError('Confirmed file is not the same as the selected!')
+        # Each job gets its own working directory. The package is renamed after the files are copied to the job
+        # directory, so the directory is named after the key before renaming (the name is only for information).
+        self._processing_paths.set_job(self._package.key, job_id=self._job_id)
         # Copying files and load instrument files object
         new_path = self._copy_all_files_with_same_file_stem_to_working_dir(path)
         self._package = file_explorer.get_package_for_file(new_path, old_key=self._old_key, no_datetime_from_file_name=True)
@@ -118,7 +137,8 @@ class SBEProcessing:
                                         processing_paths=self._processing_paths,
                                         instrument_files=self._package)
         self._batch_file = SBEBatchFile(file_handler=self._file_handler,
-                                        processing_paths=self._processing_paths)
+                                        processing_paths=self._processing_paths,
+                                        executor=self._batch_executor)
         self._confirmed = True
         return self._package['hex']
 
@@ -149,12 +169,10 @@ class SBEProcessing:
         self._copy_plot_files_to_local()
 
     def _copy_all_files_with_same_file_stem_to_working_dir(self, file_path):
-        target_directory = self._file_handler('local', 'temp')
-        stem = file_path.stem.lower()
+        target_directory = self._processing_paths.working_directory
         return_path = None
-        for path in file_path.parent.iterdir():
-            if path.stem.lower() == stem:
-                return_path = self._copy_file(path, target_directory, overwrite=True)
+        for path in directory_index.get_paths_with_stem(file_path.parent, file_path.stem):
+            return_path = self._copy_file(path, target_directory, overwrite=True)
         return return_path
 
     def _copy_file(self, source_file, target_directory, overwrite=False):
@@ -171,6 +189,7 @@ class SBEProcessing:
             else:
                 os.remove(target_file_path)
         shutil.copy2(source_file_path, target_file_path)
+        directory_index.invalidate(target_file_path.parent)
         return target_file_path
 
     def get_file_names_in_server_directory(self, subfolder=None):
@@ -197,42 +216,89 @@ class SBEProcessing:
         man = ManipulateDatCnv(datcnv)
         man.remove_parameters_not_in_xmlcon(xmlcon)
 
-    def run_process(self, overwrite=False, ignore_mismatch=False, try_fixing_mismatch=False, **kwargs):
+    def _get_manifest(self):
+        return ProcessingManifest(pathlib.Path(self._file_handler('local', 'temp'), 'manifests',
+                                               f'{self._package.key}.json'))
+
+    def _get_manifest_inputs(self):
+        raw_paths = sorted(file.path for file in self._package.get_raw_files())
+        psa_paths = sorted(self._processing_paths.get_psa_paths())
+        # All options given in set_options. Station is the title in the plot psa files.
+        options = {'platform': self._processing_paths.platform,
+                   'surfacesoak': self._surfacesoak,
+                   'tau': self._tau_state,
+                   'station': self._package('station', pref_suffix='.hdr'),
+                   'old_key': self._old_key}
+        return ProcessingManifest.get_inputs(raw_paths, psa_paths, options)
+
+    def _get_manifest_output_paths(self):
+        paths = [file.path for file in self._package.get_raw_files()]
+        paths.extend([file.path for file in self._package.get_plot_files()])
+        paths.append(self._package.get_file_path(suffix='.cnv', prefix=None))
+        paths.append(self._package.get_file_path(suffix='.zip'))
+        return [path for path in paths if path]
+
+    def _finish_job(self):
+        # Working directory is kept if processing fails so that the job can be run again
+        if not self._keep_job_directory:
+            self._processing_paths.remove_job_directory()
+            self._confirmed = False
+
+    def run_process(self, overwrite=False, ignore_mismatch=False, try_fixing_mismatch=False, force=False, **kwargs):
+        """
+        Runs the processing. Processing is skipped if the raw files, psa files and options are the same as the last
+        time the package was processed and the output files are unchanged. Use force=True to always process.
+        """
         if not self._confirmed:
             raise Exception('No file confirmed!')
+        manifest = self._get_manifest()
+        # Inputs are taken before the psa files in the job directory are changed
+        manifest_inputs = self._get_manifest_inputs()
+        if not force and manifest.is_unchanged(manifest_inputs):
+            logger.info(f'Input files unchanged since last processing. Skipping package: {self._package.key}')
+            self._package = self._get_local_package(**kwargs)
+            self._finish_job()
+            return self._package
         if try_fixing_mismatch:
             self._try_fixing_mismatch()
         elif not ignore_mismatch:
             self._check_files_mismatch()
         self._overwrite = bool(overwrite)
+        self._apply_tau_state()
         self._setup_file.create_file()
         self._batch_file.create_file()
-        self._batch_file.run_file()
+        self.module_timings = self._batch_file.run_file()
 
         key = self._package.key
 
-        print('BEFORE')
-        print(self._file_handler('local', 'temp'))
-        file_explorer.update_package_with_files_in_directory(self._package, self._file_handler('local', 'temp'))
-        print('AFTER')
+        working_directory = self._processing_paths.working_directory
+        logger.debug(f'Updating package {key} with files in working directory: {working_directory}')
+        file_explorer.update_package_with_files_in_directory(self._package, working_directory)
 
         modify_cnv.modify_cnv_down_file(self._package,
                                         directory=self._file_handler('local', 'cnv'),
                                         overwrite=self._overwrite)
+        directory_index.invalidate(self._file_handler('local', 'cnv'))
 
         self.create_zip_with_psa_files()
-        self._package = file_explorer.get_package_for_key(key, directory=self._file_handler('local', 'temp'),
+        self._package = file_explorer.get_package_for_key(key, directory=working_directory,
                                                           exclude_directory='create_standard_format',
                                                           exclude_string='ctd_std_fmt',
                                                           **kwargs)
-        print(f'A {self._package=}')
+        logger.debug(f'Package in working directory: {self._package}')
         self._copy_processed_files_to_local()
-        self._package = file_explorer.get_package_for_file(self._package['hex'],
-                                                           directory=self._file_handler('local'),
-                                                           exclude_directory='temp', **kwargs)
-        print(f'B {self._package=}')
+        self._package = self._get_local_package(**kwargs)
+        logger.debug(f'Local package: {self._package}')
+        manifest.save(manifest_inputs, self._get_manifest_output_paths())
+        self._finish_job()
         return self._package
 
+    def _get_local_package(self, **kwargs):
+        """ Returns the package with the files for the cast in the whole local root (temp excluded) """
+        return file_explorer.get_package_for_file(self._package['hex'],
+                                                  directory=self._file_handler('local'),
+                                                  exclude_directory='temp', **kwargs)
+
     def create_zip_with_psa_files(self):
         from zipfile import ZipFile
         hex_file = self._package.get_file(suffix='.hex')
@@ -273,13 +339,30 @@ class SBEPostProcessing:
     #     self._file_handler.set_root_dir('config', config_root_directory)
 
     def create_all_files(self):
-        self.create_sensorinfo_files()
-        self.create_metadata_file()
-        self.create_deliverynote_file()
+        self.create_independent_files()
         self.update_package()
         self.create_standard_format_file()
         return self._pack
 
+    def create_independent_files(self):
+        """
+        Creates sensorinfo, metadata and deliverynote files at the same time (in threads). The files only depends on
+        the files already in the package. If any of them fails the exception is raised when all are finished.
+        """
+        functions = [self.create_sensorinfo_files,
+                     self.create_metadata_file,
+                     self.create_deliverynote_file]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(functions)) as executor:
+            futures = [executor.submit(func) for func in functions]
+        errors = []
+        for func, future in zip(functions, futures):
+            error = future.exception()
+            if error:
+                logger.error(f'{func.__name__} failed for package {self._pack.key}: {error}')
+                errors.append(error)
+        if errors:
+            raise errors[0]
+
     def create_sensorinfo_files(self):
         sensor_info.create_sensor_info_files_from_package(self._pack,
                                                           self._file_handler.instrument_file_path,
@@ -299,6 +382,11 @@ class SBEPostProcessing:
     def create_standard_format_file(self):
         obj = standard_format.CreateStandardFormat(file_handler=self._file_handler, **self._kwargs)
         obj.create_from_package(self._pack)
+        self.update_package_with_standard_format()
+
+    def update_package_with_standard_format(self):
+        """ Adds the standard format file in local/data to the package. Also adds svepa information """
+        self._file_handler.set_year(self._pack('year'))
         file_explorer.update_package_with_files_in_directory(self._pack, self._file_handler('local', 'data'),
                                                              **self._kwargs)
         self._add_svepa_info()
@@ -1,5 +1,13 @@
+import logging
 import os
 import pathlib
+import shutil
+import time
+import uuid
+
+from ctd_processing import directory_index
+
+logger = logging.getLogger(__name__)
 
 
 class SBEProcessingPaths:
@@ -8,6 +16,8 @@ class SBEProcessingPaths:
     For the moment the paths are hardcoded according. Consider putting this information in a config file.
 
     """
+    # Job directories not modified for this many seconds are considered left by finished or failed jobs
+    job_directory_max_age = 24 * 3600
 
     def __init__(self, file_handler=None):
         """ Config root path is the root path och ctd_config repo """
@@ -16,6 +26,10 @@ class SBEProcessingPaths:
         self._file_handler = file_handler
 
         self._platform = None
+        self._job_id = None
+        self._job_directory = None
+        # Copies of psa files in the job directory (source path: copy path)
+        self._job_psa_paths = {}
         self._new_file_stem = None
         self._loopedit_paths = []
         self._platform_paths = {}
@@ -56,16 +70,123 @@ class SBEProcessingPaths:
         Files in the subfolders are specific for the corresponding "platform"
         """
         self._platform_paths = {}
-        for path in pathlib.Path(self._file_handler('config', 'root'), 'SBE', 'processing_psa').iterdir():
+        for path in directory_index.get_paths(pathlib.Path(self._file_handler('config', 'root'), 'SBE', 'processing_psa')):
             if path.is_file():
                 continue
             self._platform_paths[path.name.lower()] = path
 
+    @property
+    def job_id(self):
+        return self._job_id
+
+    @property
+    def working_directory(self):
+        """ Directory for setup file, batch file and intermediate files. The job directory if set, else local temp """
+        if self._job_directory:
+            return self._job_directory
+        return pathlib.Path(self._file_handler('local', 'temp'))
+
+    def set_job(self, package_key, job_id=None):
+        """
+        Sets a separate working directory for the job: <local temp>/jobs/<package_key>_<job_id>.
+        This makes it possible to run several jobs at the same time in the same local root. The psa files used in the
+        job are copied to the job directory and all changes to them (tau, station name etc.) are made in the copies.
+        The job directory is removed by remove_job_directory. Directories left by other jobs (e.g. failed jobs that
+        are kept so they can be run again) are removed when they are older than job_directory_max_age. Jobs that are
+        still running are never removed, whatever package they belong to. package_key is only used in the name of the
+        directory.
+        """
+        self.remove_job_directory()
+        self._remove_old_job_directories()
+        self._job_id = str(job_id or uuid.uuid4().hex[:8])
+        self._job_directory = pathlib.Path(self._jobs_directory, f'{package_key}_{self._job_id}')
+        os.makedirs(self._job_directory, exist_ok=True)
+        self._new_file_stem = None
+        self._copy_psa_paths_to_job_directory()
+        self.update_paths()
+
+    @property
+    def _jobs_directory(self):
+        return pathlib.Path(self._file_handler('local', 'temp'), 'jobs')
+
+    def _remove_old_job_directories(self):
+        if not self._jobs_directory.exists():
+            return
+        now = time.time()
+        for path in self._jobs_directory.iterdir():
+            if not path.is_dir():
+                continue
+            try:
+                age = now - os.stat(path).st_mtime
+            except OSError:
+                continue
+            if age > self.job_directory_max_age:
+                logger.info(f'Removing old job directory: {path}')
+                shutil.rmtree(path, ignore_errors=True)
+        directory_index.invalidate(self._jobs_directory)
+
+    def remove_job_directory(self):
+        """ Removes the job directory and all files in it """
+        if not self._job_directory:
+            return
+        logger.debug(f'Removing job directory: {self._job_directory}')
+        shutil.rmtree(self._job_directory, ignore_errors=True)
+        directory_index.invalidate(self._job_directory)
+        # psa paths are set back to the original files. Files only present in the job directory (e.g. from a psa zip)
+        # are replaced by the files for the platform.
+        source_paths = {target_path: path for path, target_path in self._job_psa_paths.items()}
+        rebuild_psa_paths = False
+        for key, path in list(self._paths.items()):
+            if not key.startswith('psa_'):
+                continue
+            if path in source_paths:
+                self._paths[key] = source_paths[path]
+            elif self._job_directory in path.parents:
+                self._paths.pop(key)
+                rebuild_psa_paths = True
+        self._job_directory = None
+        self._job_id = None
+        self._new_file_stem = None
+        self._job_psa_paths = {}
+        for key in ['config', 'hex', 'ros', 'cnv', 'cnv_down', 'cnv_up']:
+            self._paths.pop(key, None)
+        if rebuild_psa_paths and self._platform:
+            self._build_psa_file_paths()
+        self.update_paths()
+
+    def _get_job_psa_path(self, path):
+        """
+        Returns the path to the copy of psa file path in the job directory. The file is copied the first time.
+        Returns path if no job is set or if path already is in the job directory.
+        """
+        path = pathlib.Path(path)
+        if not self._job_directory or self._job_directory in path.parents:
+            return path
+        if path in self._job_psa_paths:
+            return self._job_psa_paths[path]
+        directory = pathlib.Path(self._job_directory, 'psa')
+        target_path = pathlib.Path(directory, path.name)
+        nr = 0
+        while target_path in self._job_psa_paths.values():
+            # Same file name from another directory (platform and common)
+            nr += 1
+            target_path = pathlib.Path(directory, str(nr), path.name)
+        os.makedirs(target_path.parent, exist_ok=True)
+        shutil.copy2(path, target_path)
+        self._job_psa_paths[path] = target_path
+        return target_path
+
+    def _copy_psa_paths_to_job_directory(self):
+        for key, path in list(self._paths.items()):
+            if key.startswith('psa_'):
+                self._paths[key] = self._get_job_psa_path(path)
+
     def update_paths(self):
+        """ Updates setup, batch, raw and cnv file paths. psa paths are only built when platform or job is changed """
         if self._file_handler.root_dir_is_set('local') and self._file_handler('local', 'temp'):
             # print("= self._file_handler('local', 'temp')", self._file_handler('local', 'temp'))
-            self._paths['file_setup'] = pathlib.Path(self._file_handler('local', 'temp'), 'ctdmodule.txt')
-            self._paths['file_batch'] = pathlib.Path(self._file_handler('local', 'temp'), 'SBE_batch.bat')
+            self._paths['file_setup'] = pathlib.Path(self.working_directory, 'ctdmodule.txt')
+            self._paths['file_batch'] = pathlib.Path(self.working_directory, 'SBE_batch.bat')
 
         if self._file_handler.root_dir_is_set('config') and self._file_handler('config', 'root'):
             self._save_platform_paths()
@@ -75,19 +196,18 @@ class SBEProcessingPaths:
             self._build_raw_file_paths_with_new_file_stem()
             self._build_cnv_file_paths_with_new_file_stem()
 
-        if self._platform:
-            # print('= self._platform', self._platform)
-            self._build_psa_file_paths()
-            self._build_loopedit_file_paths()
-
     @property
     def loopedit_paths(self):
-        self.update_paths()
+        if not self._platform:
+            return []
+        self._save_platform_paths()
+        self._build_loopedit_file_paths()
         return self._loopedit_paths
 
     @property
     def platforms(self):
-        self.update_paths()
+        if self._file_handler.root_dir_is_set('config') and self._file_handler('config', 'root'):
+            self._save_platform_paths()
         exclude = ['archive', 'common']
         return [name for name in self._platform_paths if name not in exclude]
 
@@ -100,7 +220,10 @@ class SBEProcessingPaths:
         plat = platform.lower()
         if plat not in self.platforms:
             raise Exception(f'Invalid platform for SBE processing_psa: {platform}')
+        if plat == self._platform and self.get_psa_paths():
+            return
         self._platform = plat
+        self._build_psa_file_paths()
         self.update_paths()
 
     def set_raw_file_path(self, file_path):
@@ -112,11 +235,11 @@ class SBEProcessingPaths:
 
     def _build_raw_file_paths_with_new_file_stem(self):
         """ Builds the raw file paths from working directory and raw file stem """
-        self._paths['config'] = pathlib.Path(self._file_handler('local', 'temp'), f'{self._new_file_stem}.XMLCON')  #
+        self._paths['config'] = pathlib.Path(self.working_directory, f'{self._new_file_stem}.XMLCON')  #
         # Handle
         # CON-files
-        self._paths['hex'] = pathlib.Path(self._file_handler('local', 'temp'), f'{self._new_file_stem}.hex')
-        self._paths['ros'] = pathlib.Path(self._file_handler('local', 'temp'), f'{self._new_file_stem}.ros')
+        self._paths['hex'] = pathlib.Path(self.working_directory, f'{self._new_file_stem}.hex')
+        self._paths['ros'] = pathlib.Path(self.working_directory, f'{self._new_file_stem}.ros')
 
         for name in ['config', 'hex']:
             if not self._paths[name].exists():
@@ -124,9 +247,9 @@ class SBEProcessingPaths:
 
     def _build_cnv_file_paths_with_new_file_stem(self):
         """ Builds the cnv file paths from working directory and raw file stem """
-        self._paths['cnv'] = pathlib.Path(self._file_handler('local', 'temp'), f'{self._new_file_stem}.cnv')
-        self._paths['cnv_down'] = pathlib.Path(self._file_handler('local', 'temp'), f'd{self._new_file_stem}.cnv')
-        self._paths['cnv_up'] = pathlib.Path(self._file_handler('local', 'temp'), f'u{self._new_file_stem}.cnv')
+        self._paths['cnv'] = pathlib.Path(self.working_directory, f'{self._new_file_stem}.cnv')
+        self._paths['cnv_down'] = pathlib.Path(self.working_directory, f'd{self._new_file_stem}.cnv')
+        self._paths['cnv_up'] = pathlib.Path(self.working_directory, f'u{self._new_file_stem}.cnv')
 
     def _build_psa_file_paths(self):
         """
@@ -158,7 +281,7 @@ class SBEProcessingPaths:
 
     @staticmethod
     def _get_paths_in_directory(directory):
-        return [path for path in directory.iterdir()]
+        return directory_index.get_paths(directory)
 
     def set_loopedit(self, path):
         """ Manually setting the loopedit file """
@@ -167,10 +290,10 @@ class SBEProcessingPaths:
             raise Exception(f'Invalid LoopEdit file: {path}')
         elif not path.exists():
             raise FileNotFoundError(path)
-        self._paths['psa_loopedit'] = path
+        self._paths['psa_loopedit'] = self._get_job_psa_path(path)
 
     def set_config_suffix(self, suffix):
-        self._paths['config'] = pathlib.Path(self._file_handler('local', 'temp'), f'{self._new_file_stem}{suffix}')
+        self._paths['config'] = pathlib.Path(self.working_directory, f'{self._new_file_stem}{suffix}')
 
     def get_psa_paths(self):
         return [value for key, value in self._paths.items() if key.startswith('psa_')]
@@ -184,7 +307,7 @@ class SBEProcessingPaths:
             for path in psa_paths:
                 if name not in path.name.lower():
                     continue
-                self._paths[f'psa_{name}'] = path
+                self._paths[f'psa_{name}'] = self._get_job_psa_path(path)
                 break
             else:
                 raise Exception(f'Could not find psa file associated with: {name}')
@@ -194,11 +317,11 @@ class SBEProcessingPaths:
             for path in psa_paths:
                 if name not in path.name.lower():
                     continue
-                self._paths[f'psa_{name}'] = path
+                self._paths[f'psa_{name}'] = self._get_job_psa_path(path)
                 break
 
     def load_psa_config_zip(self, zip_path):
-        target_dir = pathlib.Path(self._file_handler('local', 'temp'), zip_path.stem)
+        target_dir = pathlib.Path(self.working_directory, zip_path.stem)
         from zipfile import ZipFile
         with ZipFile(zip_path, 'r') as zip_ref:
             zip_ref.extractall(target_dir)
@@ -1,35 +1,129 @@
+import copy
+import hashlib
+import json
+import os
+
+import numpy as np
 import pandas as pd
 import pathlib
 import openpyxl
 
 import logging
 
+from ctd_processing.value_format import SubstringMatcher
+
 
 logger = logging.getLogger(__name__)
 
+# Parsed instrument files in this process (as json strings). Key is (path, size, mtime)
+_cache = {}
+
+
+def get_cache_directory():
+    """ Returns the user cache directory for ctd_processing """
+    root = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') or pathlib.Path.home() / '.cache'
+    return pathlib.Path(root, 'ctd_processing')
+
+
+def _get_json_value(value):
+    """ Values from the excel file are stored as str, int, float or bool so that they can be cached as json """
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, (str, bool, int, float)):
+        return value
+    return str(value)
+
 
 class InstrumentFile:
-    def __init__(self, file_path):
+    """
+    Sensor information from the instrument excel file.
+    Parsing the excel file is slow so the result is cached in memory and as a json file in the user cache directory
+    (see get_cache_directory). The cache is used as long as path, size and modification time of the excel file are the
+    same.
+    """
+    cache_version = 2
+
+    def __init__(self, file_path, use_cache=True, cache_directory=None):
         self._path = pathlib.Path(file_path)
+        self._cache_directory = pathlib.Path(cache_directory) if cache_directory else get_cache_directory()
 
-        self._wb = openpyxl.load_workbook(self._path)
-        self._sheets = self._wb.sheetnames
+        self._wb = None
+        self._sheets = []
 
         self._info = {}
+        self._keys = []
+        self._key_matcher = None
+        self._match_cache = {}
 
-        self._save_info()
+        if not (use_cache and self._load_from_cache()):
+            self._wb = openpyxl.load_workbook(self._path)
+            self._sheets = self._wb.sheetnames
+            self._save_info()
+            if use_cache:
+                self._save_to_cache()
         # self._add_cnv_code_to_pars()
+        # The index is built once, after self._info is complete
+        self._build_index()
 
     def __str__(self):
         return f'InstrumentFile: {self._path}'
 
+    @property
+    def _cache_key(self):
+        stat = os.stat(self._path)
+        return [str(self._path.absolute()), stat.st_size, stat.st_mtime_ns]
+
+    @property
+    def _cache_file_path(self):
+        name = hashlib.sha256(str(self._path.absolute()).encode('utf-8')).hexdigest()[:16]
+        return pathlib.Path(self._cache_directory, f'instrument_file_{name}.json')
+
+    def _load_from_cache(self):
+        key = self._cache_key
+        cached_string = _cache.get(tuple(key)) or self._load_cache_file()
+        if not cached_string:
+            return False
+        try:
+            cached = json.loads(cached_string)
+        except ValueError:
+            return False
+        if not isinstance(cached, dict) or cached.get('version') != self.cache_version or cached.get('key') != key:
+            return False
+        _cache[tuple(key)] = cached_string
+        # json.loads gives a new copy of the info for every InstrumentFile
+        self._sheets = cached['sheets']
+        self._info = cached['info']
+        return True
+
+    def _load_cache_file(self):
+        try:
+            with open(self._cache_file_path, encoding='utf-8') as fid:
+                return fid.read()
+        except OSError:
+            return None
+
+    def _save_to_cache(self):
+        key = self._cache_key
+        cached_string = json.dumps(dict(version=self.cache_version, key=key, sheets=self._sheets, info=self._info))
+        _cache[tuple(key)] = cached_string
+        temp_path = pathlib.Path(self._cache_directory, f'.{self._cache_file_path.name}.{os.getpid()}.tmp')
+        try:
+            os.makedirs(self._cache_directory, exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as fid:
+                fid.write(cached_string)
+            os.replace(temp_path, self._cache_file_path)
+        except OSError:
+            logger.debug(f'Could not write cache file: {self._cache_file_path}')
+            if temp_path.exists():
+                os.remove(temp_path)
+
     def _save_info(self):
         self._info = {}
         # df = pd.read_excel(self._path, sheet_name='Instrument.xls', engine='openpyxl', skiprows=[0])
         df = pd.read_excel(self._path, sheet_name='Sensor_info', engine='openpyxl', skiprows=[0])
         df = df.fillna('')
         for i in df.index:
-            data = df.iloc[i].to_dict()
+            data = {str(key): _get_json_value(value) for key, value in df.iloc[i].to_dict().items()}
             cnv_name = str(df.iloc[i]['CNV_NAME'])
             if cnv_name == '':
                 continue
@@ -61,14 +155,31 @@ class InstrumentFile:
                     continue
                 self._info[cnv_code] = self._info[cnv_name]['all']
 
+    def _build_index(self):
+        """ Index over the keys in self._info. Substring matches keep the order of the keys in self._info """
+        self._keys = list(self._info)
+        self._key_matcher = SubstringMatcher([str(key) for key in self._keys])
+        self._match_cache = {}
+
+    def _get_first_key_in_parameter(self, parameter):
+        if parameter not in self._match_cache:
+            index = self._key_matcher.get_first_match(parameter)
+            self._match_cache[parameter] = None if index is None else self._keys[index]
+        return self._match_cache[parameter]
+
     def get_info_for_parameter_and_sensor_id(self, parameter, sensor_id=None):
-        """ Returns information from self._info. Matches key in self._info where key is part of "parameter" """
-        for key, info in self._info.items():
-            logger.debug(f'key: {key}')
-            # logger.debug(f'type(key): {type(key)}')
-            logger.debug(f'par: {parameter}')
-            logger.debug(f'sensor_id: {sensor_id}')
-            if key == parameter and sensor_id is None:
-                return info
-            if key in parameter and sensor_id:
-                return info.get(str(sensor_id))
+        """
+        Returns information from self._info.
+        If sensor_id is None the key must be equal to "parameter".
+        Else the first key in self._info that is part of "parameter" is used.
+        Returns a copy. Changes to the returned information does not affect the instrument file object or the cache.
+        """
+        logger.debug(f'par: {parameter}, sensor_id: {sensor_id}')
+        if sensor_id is None:
+            return copy.deepcopy(self._info.get(parameter))
+        if not sensor_id:
+            return None
+        key = self._get_first_key_in_parameter(parameter)
+        if key is None:
+            return None
+        return copy.deepcopy(self._info[key].get(str(sensor_id)))
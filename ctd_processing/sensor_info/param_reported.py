@@ -5,12 +5,17 @@ logger = logging.getLogger(__name__)
 
 
 class ParamReported:
-    def __init__(self, cnv_file_path=None, instrument_file=None):
+    def __init__(self, cnv_file_path=None, instrument_file=None, parsed_cast=None):
+        """ parsed_cast is a ParsedCast object. If given the cnv file is not parsed again """
         self.cnv_file_path = cnv_file_path
         self.instrument_file = instrument_file
 
-        self.cnv_file = ModifyCnv(self.cnv_file_path)
-        self.cnv_reported_names = self.cnv_file.get_reported_names()
+        if parsed_cast:
+            self.cnv_file = parsed_cast.cnv
+            self.cnv_reported_names = parsed_cast.reported_names
+        else:
+            self.cnv_file = ModifyCnv(self.cnv_file_path, lazy=True)
+            self.cnv_reported_names = self.cnv_file.get_reported_names()
 
     def get_reported_name(self, parameter, sensor_id=None):
         logger.info("=" * 50)
@@ -0,0 +1,31 @@
+import pathlib
+
+from ctd_processing.modify_cnv import ModifyCnv
+
+
+class ParsedCast:
+    """
+    A cnv file parsed once and shared by all steps creating the sensorinfo file.
+    Only the header is read (lazy ModifyCnv). ModifyCnv is a file_explorer CnvFile so file information is
+    available by calling the object, ex: cast('instrument_number').
+    """
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.cnv = ModifyCnv(self.path, lazy=True)
+        self._reported_names = None
+
+    def __str__(self):
+        return f'ParsedCast: {self.path}'
+
+    def __call__(self, *args, **kwargs):
+        return self.cnv(*args, **kwargs)
+
+    @property
+    def reported_names(self):
+        if self._reported_names is None:
+            self._reported_names = self.cnv.get_reported_names()
+        return self._reported_names[:]
+
+    def get_sensor_info(self):
+        return self.cnv.get_sensor_info()
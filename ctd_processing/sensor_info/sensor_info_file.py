@@ -1,12 +1,9 @@
-import os
 import pathlib
 
-import file_explorer
-
-from ctd_processing.modify_cnv import ModifyCnv
 from ctd_processing.sensor_info import param_reported
+from ctd_processing.sensor_info.parsed_cast import ParsedCast
 from .func import get_sensor_info_columns
-from .sensor_info_item import SensorInfoItem
+from .sensor_info_item import SensorInfoAggregator
 
 
 class CreateSensorInfoFile:
@@ -19,28 +16,30 @@ class CreateSensorInfoFile:
     def __str__(self):
         return f'CreateSensorInfoFile: {self._stem}'
 
-    def create_file_from_cnv_file(self, cnv_file_path, **kwargs):
+    def create_file_from_cnv_file(self, cnv_file_path, parsed_cast=None, **kwargs):
         """
         Created a sensor info file with information in given cnv file.
         The sensor info file is created at the same location as the cnv file.
+        parsed_cast is a ParsedCast object for the cnv file. The cnv file is parsed if not given.
         """
         path = pathlib.Path(cnv_file_path)
         self._stem = path.stem
         output_dir = path.parent
         self._save_path = pathlib.Path(output_dir, f'{self._stem}.sensorinfo')
-        self._save_xml_data_from_cnv(path)
+        self._save_xml_data_from_cnv(parsed_cast or ParsedCast(path))
         self._save_file(overwrite=kwargs.get('overwrite'))
 
-    def _save_xml_data_from_cnv(self, path):
-        cnv_file = ModifyCnv(path)
+    def _save_xml_data_from_cnv(self, cast):
+        # The cnv file is parsed once (cast) and used for sensor info, reported names and file information
+        path = cast.path
         self.cnv_info = []
-        self.cnv_info.extend(cnv_file.get_sensor_info())
-        self._add_header_information_to_cnv_info(cnv_file)
+        self.cnv_info.extend(cast.get_sensor_info())
+        self._add_header_information_to_cnv_info(cast)
 
         self._data = []
-        file = file_explorer.get_file_object_for_path(path)
+        file = cast
 
-        par_reported = param_reported.ParamReported(path, self.instrument_file)
+        par_reported = param_reported.ParamReported(path, self.instrument_file, parsed_cast=cast)
 
         pressure_instrument_info = self.instrument_file.get_info_for_parameter_and_sensor_id(parameter='Pressure',
                                                                                              sensor_id=file('instrument_number'))
@@ -108,8 +107,8 @@ class CreateSensorInfoFile:
                 row_list.append(value)
             self._data.append('\t'.join(row_list))
 
-    def _add_header_information_to_cnv_info(self, cnv_file):
-        names = cnv_file.get_reported_names()
+    def _add_header_information_to_cnv_info(self, cast):
+        names = cast.reported_names
         for name in names:
             cnv_code = name.split(':')[0].strip()
             info = {'parameter': cnv_code,
@@ -129,7 +128,7 @@ class CreateSensorInfoSummaryFile:
 
     def __init__(self):
         self._paths = None
-        self._sensor_info_items = {}
+        self._aggregator = SensorInfoAggregator()
 
     def create_from_packages(self, packs, output_dir, **kwargs):
         self._paths = self._get_paths_from_packages(packs)
@@ -147,37 +146,18 @@ class CreateSensorInfoSummaryFile:
         return paths
 
     def _save_info(self):
-        self._sensor_info_items = {}
+        self._aggregator = SensorInfoAggregator(columns=self._aggregator.columns)
         for path in self._paths:
-            header = None
-            with open(path) as fid:
-                for r, line in enumerate(fid):
-                    split_line = [item.strip() for item in line.strip().split('\t')]
-                    if r == 0:
-                        header = split_line
-                        continue
-                    data = dict(zip(header, split_line))
-                    key = SensorInfoItem.get_key(data)
-                    par = key[1]
-                    self._sensor_info_items.setdefault(par, [])
-                    if not self._sensor_info_items[par] or self._sensor_info_items[par][-1]['key'] != key:
-                        self._sensor_info_items[par].append(dict(key=key,
-                                                                 obj=SensorInfoItem()))
-                    self._sensor_info_items[par][-1]['obj'].add_data(data)
+            self._aggregator.add_file(path)
 
     def write_summary_to_file(self, directory, **kwargs):
         path = pathlib.Path(directory, 'sensorinfo.txt')
         if path.exists() and not kwargs.get('overwrite'):
             raise FileExistsError(path)
-        columns = get_sensor_info_columns()
-        lines = []
-        lines.append('\t'.join(columns))
-        for par in self._sensor_info_items.keys():
-            for item in self._sensor_info_items[par]:
-                info = item['obj'].get_info()
-                lines.append('\t'.join([info.get(col, '') for col in columns]))
-
+        columns = self._aggregator.columns
         with open(path, 'w') as fid:
-            fid.write('\n'.join(lines))
+            fid.write('\t'.join(columns))
+            for info in self._aggregator.get_info():
+                fid.write('\n')
+                fid.write('\t'.join([info.get(col, '') for col in columns]))
         return path
-
@@ -85,4 +85,63 @@ class SensorInfoItem:
         info['VALIDFR'] = self._valid_from.strftime('%Y-%m-%d')
         info['VALIDTO'] = self._valid_to.strftime('%Y-%m-%d')
         info['CALIB_DATE'] = ', '.join(sorted(self._calibration_dates))
-        return info
\ No newline at end of file
+        return info
+
+
+def get_iso_date_string(time_string):
+    """ Returns time_string as YYYY-MM-DD. Strings already on this form are only validated (raises ValueError) """
+    if len(time_string) == 10 and time_string[4] == '-' and time_string[7] == '-':
+        datetime.date.fromisoformat(time_string)
+        return time_string
+    return datetime.datetime.strptime(time_string, '%Y-%m-%d').strftime('%Y-%m-%d')
+
+
+class SensorInfoAggregator:
+    """
+    Merges rows from any number of sensorinfo files in one pass.
+    Consecutive rows (per PARAM) with the same (SENSOR_ID, PARAM) are merged into one item with validity range from
+    the first to the last date in TIME and all calibration dates. Gives the same result as using SensorInfoItem but
+    the column schema is loaded once and dates are compared as ISO strings.
+    """
+
+    def __init__(self, columns=None):
+        self.columns = columns or get_sensor_info_columns()
+        self._data_columns = set(col for col in self.columns if col not in ['VALIDFR', 'VALIDTO'])
+        # par: list of [key, data, valid_from, valid_to, calibration_dates]
+        self._items = {}
+
+    def add_data(self, data):
+        if not self._data_columns.issuperset(data):
+            raise Exception('Invalid data to SensorInfoItem')
+        key = SensorInfoItem.get_key(data)
+        date = get_iso_date_string(data['TIME'])
+        items = self._items.setdefault(key[1], [])
+        if not items or items[-1][0] != key:
+            items.append([key, data, date, date, {data['CALIB_DATE']}])
+            return
+        item = items[-1]
+        if date < item[2]:
+            item[2] = date
+        elif date > item[3]:
+            item[3] = date
+        item[4].add(data['CALIB_DATE'])
+
+    def add_file(self, path):
+        with open(path) as fid:
+            header = None
+            for r, line in enumerate(fid):
+                split_line = [item.strip() for item in line.strip().split('\t')]
+                if r == 0:
+                    header = split_line
+                    continue
+                self.add_data(dict(zip(header, split_line)))
+
+    def get_info(self):
+        """ Yields the merged information for each item """
+        for items in self._items.values():
+            for key, data, valid_from, valid_to, calibration_dates in items:
+                info = data.copy()
+                info['VALIDFR'] = valid_from
+                info['VALIDTO'] = valid_to
+                info['CALIB_DATE'] = ', '.join(sorted(calibration_dates))
+                yield info
@@ -1,14 +1,19 @@
 import codecs
+import concurrent.futures
 import datetime
 import logging
 import os
 import pathlib
 import shutil
+import uuid
 
 import file_explorer
+import numpy as np
 from ctd_processing import exceptions
+from ctd_processing import utils
 from ctd_processing.delivery_note import CreateDeliveryNote
 from ctd_processing.metadata import CreateMetadataFile
+from ctd_processing.metadata import CreateMetadataSummaryFile
 from ctd_processing.sensor_info import create_sensor_info_files_from_cnv_files
 from ctd_processing.sensor_info.sensor_info_file import CreateSensorInfoSummaryFile
 from ctdpy.core import session as ctdpy_session
@@ -170,6 +175,25 @@ class old_CreateStandardFormat:
             shutil.copy2(source_path, target_path)
 
 
+class _TxtWriter:
+    """
+    Wraps the txt writer of a ctdpy writer. ctdpy writes the data files (write_with_numpy) in threads that are not
+    returned to the caller. Here they are written in the given executor instead and the futures are kept so that we
+    can wait for the files. Everything else is handled by the ctdpy txt writer.
+    """
+
+    def __init__(self, txt_writer, executor):
+        self._txt_writer = txt_writer
+        self._executor = executor
+        self.futures = []
+
+    def __getattr__(self, item):
+        return getattr(self._txt_writer, item)
+
+    def write_with_numpy(self, data=None, save_path=None, fmt='%s'):
+        self.futures.append(self._executor.submit(np.savetxt, save_path, data, fmt=fmt))
+
+
 class CreateStandardFormat:
     def __init__(self, file_handler, **kwargs):
         self._file_handler = file_handler
@@ -215,19 +239,38 @@ class CreateStandardFormat:
                                   reader='smhi')
         datasets = s.read()
 
-        data_path = s.save_data(datasets,
-                                writer='ctd_standard_template',
-                                keep_original_file_names=True,
-                                return_data_path=True)
-
-        # Creation is threaded
-        import time
-        time.sleep(.1)
-
-        source_dir = pathlib.Path(data_path)
-        source_path = pathlib.Path(source_dir, f'{stem}.txt')
+        data_path = self._save_data(s, datasets)
+        self._copy_standard_format_file_to_local(self._pack, data_path, stem)
+
+    def _save_data(self, session, datasets):
+        """
+        Same as session.save_data with the ctd_standard_template writer, but returns first when all files are written.
+        Returns the directory with the standard format files.
+        """
+        timeout = self._kwargs.get('standard_format_timeout', 30)
+        writer = session.load_writer('ctd_standard_template')
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+        txt_writer = _TxtWriter(writer.txt_writer, executor)
+        writer.txt_writer = txt_writer
+        try:
+            writer.write(datasets, keep_original_file_names=True)
+            done, not_done = concurrent.futures.wait(txt_writer.futures, timeout=timeout)
+            if not_done:
+                raise TimeoutError(f'Standard format files not written within {timeout} seconds')
+            for future in done:
+                future.result()
+        finally:
+            for future in txt_writer.futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+        return pathlib.Path(writer.data_path)
+
+    def _copy_standard_format_file_to_local(self, pack, source_dir, stem):
+        timeout = self._kwargs.get('standard_format_timeout', 30)
+        source_path = utils.wait_for_file(pathlib.Path(source_dir, f'{stem}.txt'), timeout=timeout)
+        self._file_handler.set_year(pack('year'))
         target_dir = self._file_handler('local', 'data')
-        target_path = pathlib.Path(target_dir, f'{self._pack.key}.txt')
+        target_path = pathlib.Path(target_dir, f'{pack.key}.txt')
         if target_path.exists() and not self._kwargs.get('overwrite'):
             return
             raise FileExistsError(target_path)
@@ -240,6 +283,74 @@ class CreateStandardFormat:
         self._create_standard_format()
         self._add_svepa_info(pack)
 
+    def create_from_packages(self, packs):
+        """
+        Creates standard format files for many packages with one ctdpy session.
+        Packages are grouped on delivery note and sensorinfo (byte identical files). Cnv files in a group are put in a
+        common directory together with the common delivery note and sensorinfo file and a summary file for metadata.
+        The temporary directory is removed when done.
+        Each result is copied to local/data as <package key>.txt
+        """
+        packs = list(packs)
+        for pack in packs:
+            self._set_pack(pack)
+        for group in self._get_packages_grouped_by_delivery_note_and_sensorinfo(packs):
+            temp_dir = self._create_batch_temp_dir(group)
+            try:
+                self._create_standard_format_for_batch(group, temp_dir)
+            finally:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+            for pack in group:
+                self._add_svepa_info(pack)
+
+    @staticmethod
+    def _get_packages_grouped_by_delivery_note_and_sensorinfo(packs):
+        # The sensorinfo file of a package holds the sensors and the date of the cast. Only packages with identical
+        # sensorinfo files gives the same result as when created one by one.
+        groups = {}
+        for pack in packs:
+            key = []
+            for suffix in ['.deliverynote', '.sensorinfo']:
+                path = pack.get_file_path(suffix=suffix)
+                if not path:
+                    raise FileNotFoundError(f'No {suffix} file for package {pack.key}')
+                with open(path, 'rb') as fid:
+                    key.append(fid.read())
+            groups.setdefault(tuple(key), []).append(pack)
+        return list(groups.values())
+
+    def _create_batch_temp_dir(self, packs):
+        self._file_handler.set_year(packs[0]('year'))
+        temp_dir = pathlib.Path(self._file_handler('local', 'temp'), 'create_standard_format',
+                                f'batch_{uuid.uuid4().hex[:8]}')
+        os.makedirs(temp_dir)
+        try:
+            for pack in packs:
+                cnv_path = pack.get_file_path(suffix='.cnv', prefix=None)
+                target_path = pathlib.Path(temp_dir, cnv_path.name)
+                if target_path.exists():
+                    raise FileExistsError(target_path)
+                shutil.copy2(cnv_path, target_path)
+            shutil.copy2(packs[0].get_file_path(suffix='.deliverynote'), pathlib.Path(temp_dir, 'delivery_note.txt'))
+            shutil.copy2(packs[0].get_file_path(suffix='.sensorinfo'), pathlib.Path(temp_dir, 'sensorinfo.txt'))
+            CreateMetadataSummaryFile().create_from_packages(packs, output_dir=temp_dir)
+        except Exception:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+        return temp_dir
+
+    def _create_standard_format_for_batch(self, packs, temp_dir):
+        all_file_paths = [path for path in temp_dir.iterdir()]
+        logger.debug(f'Creating standard format for {len(packs)} packages in {temp_dir}')
+        s = ctdpy_session.Session(filepaths=[str(path) for path in all_file_paths],
+                                  reader='smhi')
+        datasets = s.read()
+
+        data_path = self._save_data(s, datasets)
+        for pack in packs:
+            stem = pack.get_file_path(suffix='.cnv', prefix=None).stem
+            self._copy_standard_format_file_to_local(pack, data_path, stem)
+
     def _add_svepa_info(self, pack):
         try:
             import svepa
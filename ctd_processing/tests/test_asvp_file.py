@@ -0,0 +1,45 @@
+import concurrent.futures
+import pathlib
+from concurrent.futures.process import BrokenProcessPool
+
+from ctd_processing import asvp_file
+
+
+class Package:
+    def __init__(self, key, cnv_path):
+        self.key = key
+        self._cnv_path = cnv_path
+
+    def get_file_path(self, prefix=None, suffix=None):
+        return self._cnv_path
+
+
+class Executor:
+    """ Stand-in for ProcessPoolExecutor. The worker for the cnv file named "broken" dies. """
+
+    def __init__(self, max_workers=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def submit(self, function, cnv_path, file_path, overwrite):
+        future = concurrent.futures.Future()
+        if cnv_path.stem == 'broken':
+            future.set_exception(BrokenProcessPool('A process in the process pool was terminated abruptly'))
+        else:
+            future.set_result((pathlib.Path(f'{cnv_path.stem}.asvp'), None))
+        return future
+
+
+def test_broken_worker_does_not_stop_other_packages(monkeypatch):
+    monkeypatch.setattr(asvp_file.concurrent.futures, 'ProcessPoolExecutor', Executor)
+    packs = [Package('first', pathlib.Path('first.cnv')),
+             Package('broken', pathlib.Path('broken.cnv')),
+             Package('no_cnv', None),
+             Package('last', pathlib.Path('last.cnv'))]
+    result = asvp_file.create_asvp_files_for_packages(packs, max_workers=2)
+    assert result == [pathlib.Path('first.asvp'), None, None, pathlib.Path('last.asvp')]
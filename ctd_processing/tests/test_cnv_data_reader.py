@@ -0,0 +1,70 @@
+import pathlib
+
+import numpy as np
+import pytest
+
+from ctd_processing.cnv_data_reader import CnvDataReader
+
+TEST_DATA_DIRECTORY = pathlib.Path(__file__).parent / 'test_data'
+CAST_PATH = TEST_DATA_DIRECTORY / 'dSBE09_1387_20220601_1000_77SE_01_0001.cnv'
+
+
+def get_expected_data(path=CAST_PATH):
+    with open(path) as fid:
+        for line in fid:
+            if line.startswith('*END*'):
+                break
+        return np.loadtxt(fid, ndmin=2)
+
+
+@pytest.fixture
+def cast_bytes():
+    return CAST_PATH.read_bytes()
+
+
+def write_file(directory, content):
+    path = pathlib.Path(directory, CAST_PATH.name)
+    path.write_bytes(content)
+    return path
+
+
+def test_read_cast():
+    expected = get_expected_data()
+    with CnvDataReader(CAST_PATH) as reader:
+        assert reader.nr_rows == len(expected)
+        assert reader.nr_columns == expected.shape[1]
+        np.testing.assert_array_equal(reader.get_data(), expected)
+        np.testing.assert_array_equal(reader.get_column(1, -5), expected[-5:, 1])
+
+
+def test_last_row_without_line_break(tmp_path, cast_bytes):
+    path = write_file(tmp_path, cast_bytes.rstrip(b'\n'))
+    expected = get_expected_data()
+    with CnvDataReader(path) as reader:
+        assert reader.nr_rows == len(expected)
+        np.testing.assert_array_equal(reader.get_data(), expected)
+        np.testing.assert_array_equal(reader.get_column(0, -1), expected[-1:, 0])
+
+
+def test_crlf_line_breaks(tmp_path, cast_bytes):
+    path = write_file(tmp_path, cast_bytes.replace(b'\n', b'\r\n'))
+    with CnvDataReader(path) as reader:
+        np.testing.assert_array_equal(reader.get_data(), get_expected_data())
+
+
+def test_header_only(tmp_path, cast_bytes):
+    path = write_file(tmp_path, cast_bytes[:cast_bytes.index(b'*END*')] + b'*END*\n')
+    with CnvDataReader(path) as reader:
+        assert reader.nr_rows == 0
+        assert reader.nr_columns == len(reader.names)
+        assert reader.get_column(1).size == 0
+        assert reader.get_data().shape == (0, reader.nr_columns)
+
+
+def test_not_fixed_record_length(tmp_path, cast_bytes):
+    header, data = cast_bytes.split(b'*END*\n')
+    rows = data.splitlines()
+    rows[10] = rows[10][1:]
+    path = write_file(tmp_path, header + b'*END*\n' + b'\n'.join(rows) + b'\n')
+    with pytest.raises(ValueError):
+        CnvDataReader(path)
@@ -0,0 +1,53 @@
+import os
+import pathlib
+
+import pytest
+
+from ctd_processing import data_delivery
+
+
+@pytest.fixture
+def source_directory(tmp_path):
+    directory = pathlib.Path(tmp_path, 'source')
+    directory.mkdir()
+    for name in ['a.cnv', 'b.cnv']:
+        pathlib.Path(directory, name).write_text(name)
+    return directory
+
+
+@pytest.fixture
+def target_directory(tmp_path):
+    directory = pathlib.Path(tmp_path, 'target')
+    directory.mkdir()
+    return directory
+
+
+def test_duplicate_pairs_are_staged_once(source_directory, target_directory):
+    source_path = pathlib.Path(source_directory, 'a.cnv')
+    target_path = pathlib.Path(target_directory, 'a.cnv')
+    staged = data_delivery.stage_files([(source_path, target_path), (source_path, target_path)])
+    assert staged == [target_path]
+    assert target_path.read_text() == 'a.cnv'
+
+
+def test_different_sources_with_same_target_are_not_staged(source_directory, target_directory):
+    target_path = pathlib.Path(target_directory, 'a.cnv')
+    with pytest.raises(ValueError):
+        data_delivery.stage_files([(pathlib.Path(source_directory, 'a.cnv'), target_path),
+                                   (pathlib.Path(source_directory, 'b.cnv'), target_path)])
+    assert list(target_directory.iterdir()) == []
+
+
+def test_target_with_same_size_and_time_but_other_content_is_staged(source_directory, target_directory):
+    source_path = pathlib.Path(source_directory, 'a.cnv')
+    target_path = pathlib.Path(target_directory, 'a.cnv')
+    data_delivery.stage_files([(source_path, target_path)])
+    assert data_delivery.stage_files([(source_path, target_path)]) == []
+
+    stat = os.stat(source_path)
+    target_path.write_text('x.cnv')
+    os.utime(target_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    with pytest.raises(FileExistsError):
+        data_delivery.stage_files([(source_path, target_path)])
+    assert data_delivery.stage_files([(source_path, target_path)], overwrite=True) == [target_path]
+    assert target_path.read_text() == 'a.cnv'
@@ -0,0 +1,59 @@
+import os
+import pathlib
+import time
+
+from ctd_processing.directory_index import DirectoryIndex
+
+
+OLD_MTIME = time.time() - 100
+
+
+def set_old_mtime(path):
+    os.utime(path, (OLD_MTIME, OLD_MTIME))
+
+
+def test_listing_is_reused_while_directory_is_unchanged(tmp_path):
+    pathlib.Path(tmp_path, 'a.cnv').touch()
+    set_old_mtime(tmp_path)
+    index = DirectoryIndex()
+    assert index.get_paths(tmp_path) == [pathlib.Path(tmp_path, 'a.cnv')]
+
+    # File added without changing the modification time of the directory (coarse time resolution)
+    pathlib.Path(tmp_path, 'b.cnv').touch()
+    set_old_mtime(tmp_path)
+    assert index.get_paths(tmp_path) == [pathlib.Path(tmp_path, 'a.cnv')]
+
+    index.invalidate(tmp_path)
+    assert len(index.get_paths(tmp_path)) == 2
+
+
+def test_recently_changed_directory_is_not_cached(tmp_path):
+    index = DirectoryIndex(mtime_resolution=2.)
+    pathlib.Path(tmp_path, 'a.cnv').touch()
+    assert len(index.get_paths(tmp_path)) == 1
+    # Same modification time as when the listing was made
+    mtime = os.stat(tmp_path).st_mtime_ns
+    pathlib.Path(tmp_path, 'b.cnv').touch()
+    os.utime(tmp_path, ns=(mtime, mtime))
+    assert len(index.get_paths(tmp_path)) == 2
+
+
+def test_old_listing_is_made_again(tmp_path):
+    index = DirectoryIndex(max_age=0.)
+    set_old_mtime(tmp_path)
+    assert index.get_paths(tmp_path) == []
+    pathlib.Path(tmp_path, 'a.cnv').touch()
+    set_old_mtime(tmp_path)
+    assert len(index.get_paths(tmp_path)) == 1
+
+
+def test_number_of_listings_is_limited(tmp_path):
+    index = DirectoryIndex(max_entries=2)
+    directories = [pathlib.Path(tmp_path, str(nr)) for nr in range(4)]
+    for directory in directories:
+        directory.mkdir()
+        set_old_mtime(directory)
+        index.get_paths(directory)
+    assert len(index._listings) == 2
+    assert list(index._listings) == [str(path.absolute()) for path in directories[-2:]]
+
@@ -0,0 +1,79 @@
+import datetime
+import json
+import pathlib
+
+import openpyxl
+import pytest
+
+from ctd_processing.sensor_info import instrument_file
+from ctd_processing.sensor_info.instrument_file import InstrumentFile
+
+COLUMNS = ['CNV_NAME', 'CNV_CODE', 'SENSOR_ID', 'PARAMETER', 'INSTRUMENT_PROD', 'CALIB_DATE', 'DECIMALS']
+ROWS = [['Temperature', 't090C, t190C', '5678, 5679', 'TEMP_CTD', 'Sea-Bird', datetime.datetime(2022, 1, 1), 4],
+        ['Pressure, Digiquartz', 'prDM', '1387', 'PRES_CTD', 'Paroscientific', datetime.datetime(2021, 6, 1), 3],
+        ['Sound Velocity', 'svCM', '', 'SOUNDVEL', '', '', 2]]
+
+
+@pytest.fixture
+def excel_path(tmp_path):
+    path = pathlib.Path(tmp_path, 'Instruments.xlsx')
+    wb = openpyxl.Workbook()
+    sheet = wb.active
+    sheet.title = 'Sensor_info'
+    sheet.append(['Sensor information'])
+    sheet.append(COLUMNS)
+    for row in ROWS:
+        sheet.append(row)
+    wb.save(path)
+    return path
+
+
+@pytest.fixture
+def cache_directory(tmp_path):
+    instrument_file._cache.clear()
+    yield pathlib.Path(tmp_path, 'cache')
+    instrument_file._cache.clear()
+
+
+def test_cache_is_json_in_cache_directory(excel_path, cache_directory):
+    InstrumentFile(excel_path, cache_directory=cache_directory)
+    assert [path.name for path in excel_path.parent.iterdir() if path.is_file()] == [excel_path.name]
+    cache_files = list(cache_directory.iterdir())
+    assert len(cache_files) == 1
+    with open(cache_files[0]) as fid:
+        assert json.load(fid)['sheets'] == ['Sensor_info']
+
+
+def test_cached_info_is_the_same_as_parsed(excel_path, cache_directory):
+    parsed = InstrumentFile(excel_path, use_cache=False)
+    InstrumentFile(excel_path, cache_directory=cache_directory)
+    from_memory = InstrumentFile(excel_path, cache_directory=cache_directory)
+    instrument_file._cache.clear()
+    from_file = InstrumentFile(excel_path, cache_directory=cache_directory)
+    for obj in [from_memory, from_file]:
+        for parameter, sensor_id in [('Temperature [ITS-90, deg C]', '5679'),
+                                     ('Pressure, Digiquartz [db]', 1387),
+                                     ('svCM', None)]:
+            expected = parsed.get_info_for_parameter_and_sensor_id(parameter, sensor_id=sensor_id)
+            assert expected
+            assert obj.get_info_for_parameter_and_sensor_id(parameter, sensor_id=sensor_id) == expected
+
+
+def test_returned_info_is_a_copy(excel_path, cache_directory):
+    obj = InstrumentFile(excel_path, cache_directory=cache_directory)
+    info = obj.get_info_for_parameter_and_sensor_id('Temperature [ITS-90, deg C]', sensor_id='5678')
+    info['PARAMETER'] = 'changed'
+    info['cnv_codes'].append('changed')
+    assert obj.get_info_for_parameter_and_sensor_id('Temperature [ITS-90, deg C]', sensor_id='5678') != info
+    other = InstrumentFile(excel_path, cache_directory=cache_directory)
+    assert other.get_info_for_parameter_and_sensor_id('Temperature [ITS-90, deg C]', sensor_id='5678') != info
+
+
+@pytest.mark.parametrize('use_cache', [False, True])
+def test_index_is_built_once(excel_path, cache_directory, monkeypatch, use_cache):
+    calls = []
+    build_index = InstrumentFile._build_index
+    monkeypatch.setattr(InstrumentFile, '_build_index', lambda self: calls.append(self) or build_index(self))
+    InstrumentFile(excel_path, use_cache=use_cache, cache_directory=cache_directory)
+    InstrumentFile(excel_path, use_cache=use_cache, cache_directory=cache_directory)
+    assert len(calls) == 2
@@ -0,0 +1,113 @@
+import pathlib
+
+import numpy as np
+import pytest
+from file_explorer.seabird import xmlcon_parser
+
+from ctd_processing.modify_cnv import ModifyCnv
+
+TEST_DATA_DIRECTORY = pathlib.Path(__file__).parent / 'test_data'
+CAST_PATH = TEST_DATA_DIRECTORY / 'dSBE09_1387_20220601_1000_77SE_01_0001.cnv'
+
+MISSING_VALUE = ModifyCnv.missing_value
+
+
+def get_true_depth_loop(pressure, density, missing_value=MISSING_VALUE, g=ModifyCnv.g):
+    """ Reference (original loop) implementation of the true depth calculation in ModifyCnv """
+    dens_0 = (density[0] + 1000.) / 1000.
+    p_0 = 0
+    depth = 0
+    true_depth = []
+    for q in range(len(pressure)):
+        if density[q] != missing_value:
+            rpres = pressure[q] * 10.
+            dens = (density[q] + 1000.) / 1000.
+            ddepth = (rpres - p_0) / ((dens + dens_0) / 2. * g)
+            dens_0 = dens
+            depth = depth + ddepth
+            p_0 = rpres
+            true_depth.append(depth)
+        else:
+            true_depth.append(missing_value)
+    return true_depth
+
+
+class Cast:
+    """ Holds the attributes used by ModifyCnv._get_calculated_true_depth """
+    missing_value = MISSING_VALUE
+    g = ModifyCnv.g
+
+    def __init__(self, pressure, density):
+        self.pressure_data = np.asarray(pressure, dtype=np.float64)
+        self.density_data = np.asarray(density, dtype=np.float64)
+
+
+def get_cast_data(path=CAST_PATH):
+    """ Returns pressure and density (sigma-t) from the cnv file """
+    with open(path) as fid:
+        names = {}
+        for line in fid:
+            if line.startswith('# name'):
+                index, name = line.split('=', 1)
+                names[name.strip()] = int(index.split()[-1])
+            if line.startswith('*END*'):
+                break
+        data = np.loadtxt(fid)
+    return data[:, names['prDM: Pressure, Digiquartz [db]']], data[:, names['sigma-t00: Density [sigma-t, kg/m^3 ]']]
+
+
+def get_true_depth(pressure, density):
+    return ModifyCnv._get_calculated_true_depth(Cast(pressure, density))
+
+
+def assert_same_as_loop(pressure, density):
+    true_depth = get_true_depth(pressure, density)
+    expected = get_true_depth_loop(pressure.tolist(), density.tolist())
+    np.testing.assert_array_equal(true_depth, expected)
+    # Values are rounded to three decimals when written to file
+    assert [round(value, 3) for value in true_depth.tolist()] == [round(value, 3) for value in expected]
+
+
+def test_true_depth_same_as_loop_for_cast():
+    pressure, density = get_cast_data()
+    assert_same_as_loop(pressure, density)
+
+
+@pytest.mark.parametrize('missing_rows', [[0],
+                                          [0, 1, 2],
+                                          [150],
+                                          [100, 101, 102, 200],
+                                          [-1],
+                                          [-3, -2, -1],
+                                          [0, 150, -1]])
+def test_true_depth_same_as_loop_with_missing_density(missing_rows):
+    pressure, density = get_cast_data()
+    density[missing_rows] = MISSING_VALUE
+    assert_same_as_loop(pressure, density)
+    assert (get_true_depth(pressure, density)[missing_rows] == MISSING_VALUE).all()
+
+
+def test_true_depth_all_density_missing():
+    pressure, density = get_cast_data()
+    density[:] = MISSING_VALUE
+    assert_same_as_loop(pressure, density)
+
+
+def test_true_depth_no_data():
+    assert get_true_depth(np.array([]), np.array([])).size == 0
+
+
+def test_sensor_info_has_the_keys_from_xmlcon_parser():
+    cnv = ModifyCnv(CAST_PATH)
+    expected = xmlcon_parser.get_sensor_info(cnv._xml_tree)
+    assert expected
+    assert cnv.sensor_info == expected
+
+
+def test_get_sensor_info_returns_copies():
+    cnv = ModifyCnv(CAST_PATH)
+    info = cnv.get_sensor_info()
+    assert [item['channel'] for item in info] == [item['channel'] for item in cnv.sensor_info]
+    assert set(info[0]) == {'channel', 'internal_parameter', 'serial_number', 'calibration_date', 'parameter'}
+    info[0]['serial_number'] = 'changed'
+    assert cnv.get_sensor_info()[0]['serial_number'] != 'changed'
@@ -0,0 +1,14 @@
+import pathlib
+
+import ctd_processing
+
+
+def test_process_sbe_files_in_process_pool(tmp_path):
+    paths = [pathlib.Path(tmp_path, f'SBE09_1387_20220601_1{nr}00_77SE_01_000{nr}.hex') for nr in range(1, 4)]
+    results = ctd_processing.process_sbe_files(paths, max_workers=2)
+    # The files do not exist. Every cast fails on its own and is reported in the same order as paths.
+    assert [result.path for result in results] == paths
+    for result in results:
+        assert not result.ok
+        assert result.pack is None
+        assert result.error
@@ -0,0 +1,78 @@
+import pathlib
+
+import pytest
+
+from ctd_processing.processing.processing_manifest import ProcessingManifest
+from ctd_processing.processing.sbe_processing import SBEProcessing
+from ctd_processing.processing.sbe_processing_paths import SBEProcessingPaths
+from ctd_processing.tests.test_sbe_processing_paths import FileHandler
+from ctd_processing.tests.test_sbe_processing_paths import PSA_NAMES
+
+KEY = 'SBE09_1387_20220601_1000_77SE_01_0001'
+
+
+class RawFile:
+    def __init__(self, path):
+        self.path = path
+
+
+class Package:
+    """ Package with a hex file and a station name """
+
+    def __init__(self, directory, station):
+        self.key = KEY
+        self.station = station
+        self._hex_path = pathlib.Path(directory, f'{KEY}.hex')
+        self._hex_path.write_text(KEY)
+
+    def __call__(self, key, **kwargs):
+        return {'station': self.station}.get(key)
+
+    def get_raw_files(self):
+        return [RawFile(self._hex_path)]
+
+
+@pytest.fixture
+def processing(tmp_path):
+    config_root = pathlib.Path(tmp_path, 'ctd_config')
+    for platform in ['common', 'sbe09', 'sbe911']:
+        directory = pathlib.Path(config_root, 'SBE', 'processing_psa', platform)
+        directory.mkdir(parents=True)
+        for name in PSA_NAMES + ['LoopEdit_deep']:
+            pathlib.Path(directory, f'{name}.psa').write_text(f'<{platform}>{name}</{platform}>')
+    local_root = pathlib.Path(tmp_path, 'local')
+    pathlib.Path(local_root, 'temp').mkdir(parents=True)
+    file_handler = FileHandler(local_root, config_root)
+
+    paths = SBEProcessingPaths(file_handler)
+    paths.platform = 'sbe09'
+    paths.set_job(KEY, job_id='a')
+    obj = SBEProcessing(file_handler=file_handler, sbe_processing_paths=paths)
+    obj._package = Package(tmp_path, 'BY31 LANDSORTSDJ')
+    obj.get_surfacesoak_options = lambda: {f'{path.stem} 0 m': path for path in paths.loopedit_paths}
+    obj.set_surfacesoak('loopedit 0 m')
+    obj.set_tau_state(False)
+    return obj
+
+
+def is_unchanged(processing, manifest):
+    return manifest.is_unchanged(processing._get_manifest_inputs())
+
+
+@pytest.mark.parametrize('change', ['platform', 'surfacesoak', 'tau', 'station', 'plot_psa'])
+def test_changed_option_gives_new_processing(processing, tmp_path, change):
+    manifest = ProcessingManifest(pathlib.Path(tmp_path, 'manifest.json'))
+    manifest.save(processing._get_manifest_inputs(), [])
+    assert is_unchanged(processing, manifest)
+
+    if change == 'platform':
+        processing.set_platform('sbe911')
+    elif change == 'surfacesoak':
+        processing.set_surfacesoak('loopedit_deep 0 m')
+    elif change == 'tau':
+        processing.set_tau_state(True)
+    elif change == 'station':
+        processing._package.station = 'BY29'
+    elif change == 'plot_psa':
+        processing._processing_paths('psa_1-seaplot').write_text('changed')
+    assert not is_unchanged(processing, manifest)
@@ -0,0 +1,185 @@
+import concurrent.futures
+import os
+import pathlib
+import threading
+import time
+
+import pytest
+
+from ctd_processing.processing import sbe_setup_file
+from ctd_processing.processing.sbe_batch_file import LocalBatchExecutor
+from ctd_processing.processing.sbe_batch_file import SBEBatchFile
+from ctd_processing.processing.sbe_processing_paths import SBEProcessingPaths
+from ctd_processing.processing.sbe_setup_file import SBESetupFile
+
+PSA_NAMES = ['DatCnv', 'Filter', 'AlignCTD', 'BottleSum', 'CellTM', 'Derive', 'BinAvg', 'LoopEdit', 'Split',
+             '1-SeaPlot', '2-SeaPlot', '3-SeaPlot', '4-SeaPlot']
+
+
+class FileHandler:
+    """ Holds the local and config root directories used by SBEProcessingPaths """
+
+    def __init__(self, local_root, config_root):
+        self._roots = {'local': pathlib.Path(local_root), 'config': pathlib.Path(config_root)}
+
+    def __call__(self, root, subdirectory='root'):
+        if subdirectory == 'root':
+            return self._roots[root]
+        return pathlib.Path(self._roots[root], subdirectory)
+
+    def root_dir_is_set(self, root):
+        return root in self._roots
+
+
+@pytest.fixture
+def file_handler(tmp_path):
+    config_root = pathlib.Path(tmp_path, 'ctd_config')
+    for platform in ['common', 'sbe09']:
+        directory = pathlib.Path(config_root, 'SBE', 'processing_psa', platform)
+        directory.mkdir(parents=True)
+        for name in PSA_NAMES:
+            pathlib.Path(directory, f'{name}.psa').write_text(f'<{platform}>{name}</{platform}>')
+    local_root = pathlib.Path(tmp_path, 'local')
+    pathlib.Path(local_root, 'temp').mkdir(parents=True)
+    return FileHandler(local_root, config_root)
+
+
+@pytest.fixture
+def paths(file_handler):
+    obj = SBEProcessingPaths(file_handler)
+    obj.platform = 'sbe09'
+    return obj
+
+
+def test_psa_files_are_copied_to_job_directory(paths, file_handler):
+    original = paths('psa_derive')
+    paths.set_job('SBE09_1387_20220601_1000_77SE_01_0001', job_id='a')
+    assert paths.working_directory in paths('psa_derive').parents
+    for path in paths.get_psa_paths():
+        assert paths.working_directory in path.parents
+    assert paths('psa_derive').read_text() == original.read_text() == '<sbe09>Derive</sbe09>'
+
+    paths('psa_derive').write_text('changed')
+    # Paths are rebuilt on update but still point to the (changed) copy
+    paths.update_paths()
+    assert paths('psa_derive').read_text() == 'changed'
+    assert original.read_text() == '<sbe09>Derive</sbe09>'
+
+    paths.remove_job_directory()
+    assert paths('psa_derive') == original
+
+
+def test_set_loopedit_uses_copy(paths):
+    paths.set_job('SBE09_1387_20220601_1000_77SE_01_0001', job_id='a')
+    source = paths.loopedit_paths[0]
+    paths.set_loopedit(source)
+    assert paths('psa_loopedit') != source
+    assert paths.working_directory in paths('psa_loopedit').parents
+
+
+def test_set_loopedit_is_kept_when_paths_are_read(paths):
+    paths.set_job('SBE09_1387_20220601_1000_77SE_01_0001', job_id='a')
+    paths.set_loopedit(paths.loopedit_paths[-1])
+    loopedit = paths('psa_loopedit')
+    psa_directory = pathlib.Path(paths.working_directory, 'psa')
+    files_in_job = sorted(psa_directory.rglob('*'))
+    assert paths.loopedit_paths
+    assert paths.platforms
+    paths.platform = 'sbe09'
+    paths.update_paths()
+    assert paths('psa_loopedit') == loopedit
+    assert sorted(psa_directory.rglob('*')) == files_in_job
+
+
+def test_only_old_job_directories_are_removed(paths, file_handler):
+    key = 'SBE09_1387_20220601_1000_77SE_01_0001'
+    other_key = 'SBE09_1387_20220601_1100_77SE_01_0002'
+    jobs_directory = pathlib.Path(file_handler('local', 'temp'), 'jobs')
+    running_job = pathlib.Path(jobs_directory, f'{key}_running')
+    old_job = pathlib.Path(jobs_directory, f'{key}_old')
+    other_old_job = pathlib.Path(jobs_directory, f'{other_key}_old')
+    for path in [running_job, old_job, other_old_job]:
+        path.mkdir(parents=True)
+    old_time = time.time() - paths.job_directory_max_age - 10
+    for path in [old_job, other_old_job]:
+        os.utime(path, (old_time, old_time))
+
+    paths.set_job(key, job_id='new')
+    assert running_job.exists()
+    assert not old_job.exists()
+    assert not other_old_job.exists()
+    assert paths.working_directory == pathlib.Path(jobs_directory, f'{key}_new')
+
+
+class PlotPSAfile:
+    """ Stand in for file_explorer.psa.PlotPSAfile. The title is written to the file on save. """
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.title = None
+
+    def save(self):
+        self.path.write_text(f'<title>{self.title}</title>')
+
+
+class Package:
+    def __init__(self, station):
+        self._station = station
+
+    def __call__(self, key, **kwargs):
+        return {'station': self._station, 'number_of_bottles': 0}.get(key)
+
+
+def copy_input_to_output(module, args, output_directory):
+    """ Engine for LocalBatchExecutor. Output holds the input and the plot psa used (checks that paths are not mixed) """
+    input_path = pathlib.Path(args['i'])
+    output_path = pathlib.Path(output_directory, f'{input_path.stem}.cnv')
+    output_path.write_text(f'{input_path.read_text()}\n{module}: {args["p"]}')
+
+
+def test_two_casts_at_the_same_time_do_not_mix_files(file_handler, monkeypatch):
+    monkeypatch.setattr(sbe_setup_file.psa, 'PlotPSAfile', PlotPSAfile)
+    casts = {'SBE09_1387_20220601_1000_77SE_01_0001': 'BY31 LANDSORTSDJ',
+             'SBE09_1387_20220601_1400_77SE_01_0002': 'BY29'}
+    barrier = threading.Barrier(len(casts))
+
+    def process(key, station):
+        paths = SBEProcessingPaths(file_handler)
+        paths.platform = 'sbe09'
+        paths.set_job(key)
+        for suffix in ['.hex', '.XMLCON']:
+            pathlib.Path(paths.working_directory, f'{key}{suffix}').write_text(key)
+        paths.set_raw_file_path(pathlib.Path(paths.working_directory, f'{key}.hex'))
+        setup_file = SBESetupFile(file_handler=file_handler, processing_paths=paths,
+                                  instrument_files=Package(station))
+        batch_file = SBEBatchFile(file_handler=file_handler, processing_paths=paths,
+                                  executor=LocalBatchExecutor(engine=copy_input_to_output))
+        barrier.wait()
+        setup_file.create_file()
+        batch_file.create_file()
+        barrier.wait()
+        batch_file.run_file()
+        return paths
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(casts)) as executor:
+        futures = {key: executor.submit(process, key, station) for key, station in casts.items()}
+    for key, station in casts.items():
+        paths = futures[key].result()
+        working_directory = paths.working_directory
+        for nr in range(1, 5):
+            assert paths(f'psa_{nr}-seaplot').read_text() == f'<title>{station}</title>'
+        setup_text = paths('file_setup').read_text(encoding='cp1252')
+        other_keys = [other_key for other_key in casts if other_key != key]
+        for other_key in other_keys:
+            assert other_key not in setup_text
+        for line in setup_text.splitlines():
+            if line.strip():
+                assert str(working_directory) in line
+        assert str(working_directory) in paths('file_batch').read_text()
+        output = pathlib.Path(working_directory, f'{key}.cnv').read_text()
+        assert output.startswith(key)
+        assert str(working_directory) in output
+
+    # Original plot psa files are unchanged
+    platform_directory = pathlib.Path(file_handler('config', 'root'), 'SBE', 'processing_psa', 'sbe09')
+    assert pathlib.Path(platform_directory, '1-SeaPlot.psa').read_text() == '<sbe09>1-SeaPlot</sbe09>'
@@ -0,0 +1,13 @@
+import pytest
+
+from ctd_processing.sensor_info.sensor_info_item import get_iso_date_string
+
+
+def test_iso_date_string_is_returned_as_is():
+    assert get_iso_date_string('2022-06-01') == '2022-06-01'
+
+
+@pytest.mark.parametrize('time_string', ['2022-13-01', '2022-02-30', '2022-6-1a', '20220601'])
+def test_invalid_date_string_raises(time_string):
+    with pytest.raises(ValueError):
+        get_iso_date_string(time_string)
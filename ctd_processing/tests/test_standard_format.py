@@ -0,0 +1,158 @@
+import pathlib
+import threading
+import time
+
+import file_explorer
+import numpy as np
+import pytest
+
+from ctd_processing import standard_format
+from ctd_processing.standard_format import CreateStandardFormat
+
+METADATA = 'MYEAR\tSTATN\tSHIPC\n2022\tBY31\t77SE\n'
+DELIVERY_NOTE = 'MYEAR: 2022\nDTYPE: PROFILE\n'
+SENSORINFO_COLUMNS = 'INSTRUMENT_SERIE\tPARAMETER\tSENSOR_ID\tTIME'
+
+
+class FileHandler:
+    """ Holds the local root directory used by CreateStandardFormat """
+
+    def __init__(self, local_root):
+        self._root = pathlib.Path(local_root)
+        self.year = None
+
+    def __call__(self, root, subdirectory):
+        path = pathlib.Path(self._root, subdirectory)
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def set_year(self, year):
+        self.year = year
+
+
+class Package(file_explorer.Package):
+    """ Package with the files needed to create a standard format file """
+
+    def __init__(self, directory, key, sensorinfo):
+        self.key = key
+        self.platform = 'sbe09'
+        self.datetime = None
+        self._paths = {}
+        for suffix, content in [('.cnv', f'* cnv {key}\n'),
+                                ('.sensorinfo', sensorinfo),
+                                ('.metadata', METADATA),
+                                ('.deliverynote', DELIVERY_NOTE)]:
+            path = pathlib.Path(directory, f'{key}{suffix}')
+            path.write_text(content)
+            self._paths[suffix] = path
+
+    def __call__(self, item):
+        if item == 'year':
+            return '2022'
+
+    def get_file_path(self, suffix=None, prefix=None):
+        return self._paths.get(suffix)
+
+
+class TxtWriter:
+    """ Like the ctdpy txt writer. Files are written in threads that are not returned. """
+
+    @staticmethod
+    def write_with_numpy(data=None, save_path=None, fmt='%s'):
+        def write():
+            time.sleep(0.05)
+            np.savetxt(save_path, data, fmt=fmt)
+        threading.Thread(target=write).start()
+
+
+class Writer:
+    def __init__(self, data_path):
+        self.data_path = str(data_path)
+        self.txt_writer = TxtWriter()
+
+    def write(self, datasets, keep_original_file_names=False):
+        pathlib.Path(self.data_path).mkdir(parents=True)
+        for name, content in datasets.items():
+            if not name.endswith('.cnv'):
+                continue
+            lines = (content + datasets['sensorinfo.txt']).splitlines()
+            self.txt_writer.write_with_numpy(data=np.array(lines),
+                                             save_path=pathlib.Path(self.data_path, name.replace('.cnv', '.txt')))
+
+
+class Session:
+    """ Stand-in for the ctdpy session. Each output file holds the cnv file and the sensorinfo given to the session """
+    nr_sessions = 0
+
+    def __init__(self, filepaths=None, reader=None):
+        Session.nr_sessions += 1
+        self._paths = [pathlib.Path(path) for path in filepaths]
+        self._export_directory = pathlib.Path(self._paths[0].parent.parent, 'export', str(Session.nr_sessions))
+
+    def read(self):
+        return {path.name: path.read_text() for path in self._paths}
+
+    def load_writer(self, writer):
+        return Writer(self._export_directory)
+
+
+@pytest.fixture
+def session(monkeypatch):
+    Session.nr_sessions = 0
+    monkeypatch.setattr(standard_format.ctdpy_session, 'Session', Session)
+    return Session
+
+
+def get_sensorinfo(date, sensor_ids):
+    lines = [SENSORINFO_COLUMNS]
+    for parameter, sensor_id in zip(['TEMP_CTD', 'SALT_CTD'], sensor_ids):
+        lines.append(f'1387\t{parameter}\t{sensor_id}\t{date}')
+    return '\n'.join(lines)
+
+
+def create_packages(directory, sensor_ids_list):
+    directory.mkdir()
+    packs = []
+    for nr, sensor_ids in enumerate(sensor_ids_list, 1):
+        key = f'SBE09_1387_20220601_1{nr}00_77SE_01_000{nr}'
+        packs.append(Package(directory, key, get_sensorinfo('2022-06-01', sensor_ids)))
+    return packs
+
+
+def get_output(file_handler):
+    return {path.name: path.read_text() for path in file_handler('local', 'data').iterdir()}
+
+
+def test_batch_gives_same_result_as_one_by_one(tmp_path, session):
+    packs = create_packages(pathlib.Path(tmp_path, 'source'), [['5678', '2345'], ['5679', '2346']])
+
+    one_by_one = FileHandler(pathlib.Path(tmp_path, 'one_by_one'))
+    for pack in packs:
+        CreateStandardFormat(one_by_one).create_from_package(pack)
+
+    batch = FileHandler(pathlib.Path(tmp_path, 'batch'))
+    CreateStandardFormat(batch).create_from_packages(packs)
+
+    assert len(get_output(batch)) == 2
+    assert get_output(batch) == get_output(one_by_one)
+    assert list(batch('local', 'temp').rglob('batch_*')) == []
+
+
+def test_packages_with_same_sensors_share_session(tmp_path, session):
+    packs = create_packages(pathlib.Path(tmp_path, 'source'), [['5678', '2345'], ['5678', '2345'], ['5679', '2345']])
+    file_handler = FileHandler(pathlib.Path(tmp_path, 'batch'))
+    CreateStandardFormat(file_handler).create_from_packages(packs)
+    assert session.nr_sessions == 2
+    assert len(get_output(file_handler)) == 3
+
+
+def test_files_are_written_when_save_data_returns(tmp_path, session):
+    directory = pathlib.Path(tmp_path, 'source')
+    directory.mkdir()
+    cnv_path = pathlib.Path(directory, 'a.cnv')
+    cnv_path.write_text('* cnv\n')
+    sensorinfo_path = pathlib.Path(directory, 'sensorinfo.txt')
+    sensorinfo_path.write_text(SENSORINFO_COLUMNS)
+    s = Session(filepaths=[cnv_path, sensorinfo_path])
+    data_path = CreateStandardFormat(FileHandler(tmp_path))._save_data(s, s.read())
+    assert pathlib.Path(data_path, 'a.txt').read_text() == f'* cnv\n{SENSORINFO_COLUMNS}\n'
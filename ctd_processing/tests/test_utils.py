@@ -0,0 +1,16 @@
+import pathlib
+
+import pytest
+
+from ctd_processing import utils
+
+
+def test_wait_for_file(tmp_path):
+    path = pathlib.Path(tmp_path, 'a.txt')
+    path.write_text('data')
+    assert utils.wait_for_file(path, timeout=5) == path
+
+
+def test_wait_for_missing_file_times_out(tmp_path):
+    with pytest.raises(TimeoutError):
+        utils.wait_for_file(pathlib.Path(tmp_path, 'a.txt'), timeout=0.05)
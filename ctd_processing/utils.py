@@ -1,6 +1,7 @@
 import pathlib
 import subprocess
 import threading
+import time
 import psutil
 import pandas as pd
 
@@ -57,6 +58,24 @@ def run_program(program, line):
     t.start()
 
 
+def wait_for_file(path, timeout=30, poll_interval=.01):
+    """
+    Waits until file path exists and its size is unchanged between two polls.
+    Raises TimeoutError if the file is not complete within timeout (seconds).
+    """
+    path = pathlib.Path(path)
+    end_time = time.monotonic() + timeout
+    last_size = None
+    while True:
+        size = path.stat().st_size if path.exists() else None
+        if size is not None and size == last_size:
+            return path
+        last_size = size
+        if time.monotonic() > end_time:
+            raise TimeoutError(f'File not created within {timeout} seconds: {path}')
+        time.sleep(poll_interval)
+
+
 def get_dataframe_from_file(file_path, **kwargs):
     kw = {'sep': '\t',
           'encoding': 'cp1252'}
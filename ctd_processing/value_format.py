@@ -1,3 +1,4 @@
+import functools
 from pathlib import Path
 
 
@@ -19,8 +20,65 @@ class Parameter:
         return self._info.get('parameter')
 
 
+class SubstringMatcher:
+    """
+    Aho-Corasick automaton over a list of keys.
+    get_first_match returns the index of the first key (in the given order) that is a substring of a string.
+    The string is scanned once regardless of the number of keys.
+    """
+
+    def __init__(self, keys):
+        self._goto = [{}]
+        self._fail = [0]
+        # Lowest key index ending at node (following fail links)
+        self._output = [None]
+        for i, key in enumerate(keys):
+            self._add_key(key, i)
+        self._build_fail_links()
+
+    def _add_key(self, key, index):
+        node = 0
+        for char in key:
+            if char not in self._goto[node]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(None)
+                self._goto[node][char] = len(self._goto) - 1
+            node = self._goto[node][char]
+        if self._output[node] is None:
+            self._output[node] = index
+
+    def _build_fail_links(self):
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                fail_output = self._output[self._fail[child]]
+                if fail_output is not None and (self._output[child] is None or fail_output < self._output[child]):
+                    self._output[child] = fail_output
+
+    def get_first_match(self, string):
+        best = self._output[0]
+        node = 0
+        for char in string:
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            output = self._output[node]
+            if output is not None and (best is None or output < best):
+                best = output
+                if best == 0:
+                    break
+        return best
+
+
 class ValueFormat:
     _parameters = None
+    cache_size = 1024
 
     def __init__(self, value_format_path=None):
         if value_format_path:
@@ -28,23 +86,34 @@ class ValueFormat:
         else:
             self._path = Path(Path(__file__).parent, 'resources', 'value_format.txt')
         self._load_file()
+        self._compile()
 
     def __call__(self, parameter):
         """
         Returns the format matching parameter.
         First check for absolute match between parameter and key.
-        If format not found we'll check if key in parameter
+        If format not found we'll check if key in parameter (first key in file order, case insensitive).
+        Results are memoized.
         """
-        par = self._parameters.get(parameter)
-        if not par:
-            for key, p in self._parameters.items():
-                if key.lower() in parameter.lower():
-                    par = p
-                    break
+        par = self._get_parameter(parameter)
         if not par:
             raise Exception(f'No format found for parameter: {parameter}')
         return par.format
 
+    def _compile(self):
+        self._keys = [key for key in self._parameters if key is not None]
+        self._matcher = SubstringMatcher([key.lower() for key in self._keys])
+        self._get_parameter = functools.lru_cache(maxsize=self.cache_size)(self._find_parameter)
+
+    def _find_parameter(self, parameter):
+        par = self._parameters.get(parameter)
+        if par:
+            return par
+        index = self._matcher.get_first_match(parameter.lower())
+        if index is None:
+            return None
+        return self._parameters[self._keys[index]]
+
     def _load_file(self):
         self._parameters = {}
         header = None